@@ -0,0 +1,92 @@
+'''
+View-side animation timeline.
+
+Tweens hold presentation state the game rules do not care about, such as
+how far the pending action slide has got. They live here rather than in
+the Model, so animating creates no game state, and they advance by
+elapsed time rather than by frame, so they run at the same speed at any
+frame rate.
+
+A tween is keyed by the object it animates, compared by identity: a new
+PendingAction starts a new slide even if it equals the last one.
+
+With a fixed simulation tick the timeline is advanced by whole ticks, and
+lead is the time since the last tick, so drawing interpolates between
+ticks.
+'''
+import time
+
+
+class Tween:
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.elapsed = 0.0
+
+    @property
+    def done(self):
+        return self.elapsed >= self.duration
+
+    def progress(self, lead=0.0):
+        if self.elapsed + lead >= self.duration:
+            return 1.0
+        return max(0.0, (self.elapsed + lead) / self.duration)
+
+
+class Timeline:
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.last = None
+        self.lead = 0.0
+        # id(key) -> (key, Tween)
+        self.tweens = {}
+        self.drawn = set()
+        # Whether a tween has moved since the last draw, so the frame
+        # cannot be reused
+        self.moving = False
+        self.started = 0
+
+    def tween(self, key, duration):
+        '''
+        Progress from 0 to 1 of the tween for key, starting it if it is new.
+        '''
+        entry = self.tweens.get(id(key))
+        if entry is None or entry[0] is not key:
+            entry = key, Tween(duration)
+            # Start at 0 when drawn, not at the last tick
+            entry[1].elapsed = -self.lead
+            self.tweens[id(key)] = entry
+            self.started += 1
+        self.drawn.add(id(key))
+        return entry[1].progress(self.lead)
+
+    def advance(self, elapsed=None):
+        '''
+        Moves every running tween on by elapsed seconds, by default the time
+        since the last call.
+        '''
+        now = self.clock()
+        if elapsed is None:
+            elapsed = 0.0 if self.last is None else now - self.last
+        self.last = now
+        for _, tween in self.tweens.values():
+            if not tween.done:
+                tween.elapsed += elapsed
+                self.moving = True
+
+    def begin_draw(self):
+        '''
+        Forgets the tweens the previous draw did not ask for, e.g. the slide
+        of an action that has been dismissed.
+        '''
+        self.tweens = {
+            key: entry for key, entry in self.tweens.items()
+            if key in self.drawn
+        }
+        self.drawn = set()
+        self.moving = False
+
+    @property
+    def active(self):
+        return any(not tween.done for _, tween in self.tweens.values())
@@ -0,0 +1,170 @@
+'''
+Offline texture atlas packer.
+
+Run `python atlas.py` after changing any of the sprite sheets in SHEETS. It
+packs them into images/atlas-N.png and writes images/atlas.json. At load
+time EventHandler maps every view.Image from a packed sheet to its region
+in the atlas, so screen code keeps using the original constants.
+'''
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import attr
+
+import utils
+import view
+
+
+MANIFEST = 'images/atlas.json'
+PAGE = 'images/atlas-{}.png'
+MAX_SIZE = 1024
+PADDING = 2
+
+# Small sheets drawn many times per frame. Full-screen backgrounds are
+# drawn once per frame (usually from a cached layer) and are left alone.
+SHEETS = [
+    'images/characters.png',
+    'images/font.png',
+    'images/menu-icons.png',
+    'images/title-bar.png',
+]
+
+
+def digest(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def pack(sizes, max_size=MAX_SIZE, padding=PADDING):
+    '''
+    Shelf-pack {name: (w, h)} into as few max_size square pages as possible.
+    Returns ({name: (page, x, y)}, [(page_w, page_h), ...]).
+    '''
+    order = sorted(sizes, key=lambda name: (-sizes[name][1], -sizes[name][0]))
+    placements = {}
+    pages = []
+
+    def new_page():
+        pages.append({'shelves': [], 'w': 0, 'h': 0})
+        return len(pages) - 1
+
+    def place(index, w, h):
+        page = pages[index]
+        for shelf in page['shelves']:
+            if h <= shelf['h'] and shelf['x'] + w <= max_size:
+                x = shelf['x']
+                shelf['x'] += w + padding
+                page['w'] = max(page['w'], x + w)
+                return x, shelf['y']
+        y = sum(shelf['h'] + padding for shelf in page['shelves'])
+        if y + h > max_size:
+            return None
+        page['shelves'].append({'y': y, 'h': h, 'x': w + padding})
+        page['w'] = max(page['w'], w)
+        page['h'] = max(page['h'], y + h)
+        return 0, y
+
+    for name in order:
+        w, h = sizes[name]
+        if w > max_size or h > max_size:
+            raise ValueError(f'{name} ({w}x{h}) does not fit in a {max_size} atlas')
+        for index in range(len(pages)):
+            position = place(index, w, h)
+            if position is not None:
+                break
+        else:
+            index = new_page()
+            position = place(index, w, h)
+        placements[name] = (index, *position)
+
+    return placements, [(page['w'], page['h']) for page in pages]
+
+
+def build(sheets=SHEETS, manifest=MANIFEST, max_size=MAX_SIZE, padding=PADDING):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit('Building the atlas requires Pillow (pip install pillow)')
+
+    sizes = {filename: utils.png_size(filename) for filename in sheets}
+    placements, page_sizes = pack(sizes, max_size, padding)
+
+    pages = [Image.new('RGBA', size, (0, 0, 0, 0)) for size in page_sizes]
+    regions = {}
+    for filename, (page, x, y) in placements.items():
+        with Image.open(filename) as sheet:
+            pages[page].paste(sheet.convert('RGBA'), (x, y))
+        w, h = sizes[filename]
+        regions[filename] = {
+            'page': page, 'x': x, 'y': y, 'w': w, 'h': h,
+            'sha1': digest(filename),
+        }
+
+    page_files = []
+    for index, image in enumerate(pages):
+        page_file = PAGE.format(index)
+        image.save(page_file)
+        page_files.append(page_file)
+
+    with open(manifest, 'w') as f:
+        json.dump({'pages': page_files, 'regions': regions}, f, indent=4, sort_keys=True)
+        f.write('\n')
+    return page_files
+
+
+class Atlas:
+
+    def __init__(self, pages, regions):
+        self.pages = pages
+        self.regions = regions
+        self.resolved = {}
+
+    def resolve(self, image):
+        try:
+            return self.resolved[image]
+        except KeyError:
+            pass
+        region = self.regions.get(image.filename)
+        if region is None:
+            result = image
+        else:
+            clip = image.clip
+            result = view.Image(
+                self.pages[region['page']],
+                attr.evolve(clip, x=clip.x + region['x'], y=clip.y + region['y'])
+            )
+        self.resolved[image] = result
+        return result
+
+
+def load(manifest=MANIFEST):
+    '''
+    Returns an Atlas, or None if there is no manifest or a packed sheet has
+    changed since the atlas was built.
+    '''
+    if not os.path.exists(manifest):
+        return None
+    with open(manifest) as f:
+        data = json.load(f)
+    for filename, region in data['regions'].items():
+        if not os.path.exists(filename) or digest(filename) != region['sha1']:
+            print(f'{manifest} is out of date, run atlas.py to rebuild it', file=sys.stderr)
+            return None
+    return Atlas(data['pages'], data['regions'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack sprite sheets into a texture atlas')
+    parser.add_argument('sheets', nargs='*', help=f'sheets to pack (default: {", ".join(SHEETS)})')
+    parser.add_argument('--max-size', type=int, default=MAX_SIZE)
+    parser.add_argument('--padding', type=int, default=PADDING)
+    args = parser.parse_args()
+    for page in build(args.sheets or SHEETS, MANIFEST, args.max_size, args.padding):
+        print(page, *utils.png_size(page))
+
+
+if __name__ == '__main__':
+    main()
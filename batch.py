@@ -0,0 +1,67 @@
+class Batch:
+
+    def __init__(self, texture):
+        self.texture = texture
+        self.copies = []
+        self.left = self.top = float('inf')
+        self.right = self.bottom = float('-inf')
+
+    def add(self, clip, dest):
+        self.copies.append((
+            clip.x, clip.y, clip.w, clip.h,
+            dest.x, dest.y, dest.w, dest.h
+        ))
+        self.left = min(self.left, dest.x)
+        self.top = min(self.top, dest.y)
+        self.right = max(self.right, dest.x + dest.w)
+        self.bottom = max(self.bottom, dest.y + dest.h)
+
+    def overlaps(self, dest):
+        return (
+            dest.x < self.right and self.left < dest.x + dest.w and
+            dest.y < self.bottom and self.top < dest.y + dest.h
+        )
+
+
+class SpriteBatch:
+    '''
+    Queues sprites and groups them by texture.
+
+    A sprite may only join an earlier batch if none of the batches queued
+    after it overlap the sprite, so the result always looks the same as
+    drawing every sprite in order.
+    '''
+
+    def __init__(self):
+        self.batches = []
+        self.last_batches = 0
+        self.last_copies = 0
+
+    def add(self, texture, clip, dest):
+        for batch in reversed(self.batches):
+            if batch.texture is texture:
+                batch.add(clip, dest)
+                return
+            if batch.overlaps(dest):
+                break
+        batch = Batch(texture)
+        batch.add(clip, dest)
+        self.batches.append(batch)
+
+    def flush(self, renderer):
+        copy_many = getattr(renderer, 'copy_many', None)
+        copies = 0
+        for batch in self.batches:
+            if copy_many is not None:
+                copy_many(batch.texture, batch.copies)
+            else:
+                for copy in batch.copies:
+                    renderer.copy(batch.texture, *copy)
+            copies += len(batch.copies)
+        self.last_batches += len(self.batches)
+        self.last_copies += copies
+        self.batches = []
+
+    def begin_frame(self):
+        self.last_batches = 0
+        self.last_copies = 0
@@ -2,6 +2,8 @@ import random
 import model
 import pyxelen
 
+from selector import selector
+
 from view import *
 from sounds import *
 from utils import *
@@ -10,12 +12,15 @@ from utils import *
 RAMP = [80, 75, 68, 59, 48, 35, 20, 3, 8, 15, 23, 33, 45, 56, 65, 72, 77]
 RAMP += [78, 78, 80, 80, 80, 80, 81, 81, 81, 81, 81, 81, 81]
 RAMP = list(reversed(RAMP))
+# The slide used to step through RAMP once per frame at 30 fps
+PENDING_SECONDS = len(RAMP) / 30
 
 
 def action(state):
     return state.scene.action
 
 
+@selector
 def target(state):
     if targeting_enemy(state):
         return enemies(state)[action(state).target]
@@ -49,10 +54,12 @@ def targeting_friend(state):
     return isinstance(action(state), model.TargetFriendlyAction)
 
 
+@selector
 def active_character(state):
     return initiative_order(state)[0]
 
 
+@selector
 def next_character(state):
     if len(initiative_order(state)) > 1:
         return initiative_order(state)[1]
@@ -72,6 +79,24 @@ def initiative(state):
     return state.scene.initiative
 
 
+FRIEND = 'friend'
+ENEMY = 'enemy'
+
+@selector
+def entity_index(state):
+    '''
+    {entity ID: (side, position)} for every combatant.
+    '''
+    index = {c.entity: (FRIEND, i) for i, c in enumerate(friends(state))}
+    index.update((c.entity, (ENEMY, i)) for i, c in enumerate(enemies(state)))
+    return index
+
+
+def side(state, character):
+    return entity_index(state).get(character.entity, (None, None))[0]
+
+
+@selector
 def initiative_order(state):
     cut = initiative(state)
     everyone = friends(state) + enemies(state)
@@ -83,8 +108,8 @@ def next_turn_initiative(state):
 
 
 def next_turn_action(state):
-    if next_character(state) in enemies(state):
-        return model.EnemyAction(countdown=30)
+    if side(state, next_character(state)) == ENEMY:
+        return model.EnemyAction()
     else:
         return model.ChooseAction()
 
@@ -115,7 +140,6 @@ def queue_action(state):
     return set_action(
         state,
         action=model.PendingAction(
-            countdown=len(RAMP) - 1,
             action=action(state),
             result=action(state).apply(state)
         )
@@ -128,9 +152,9 @@ def valid_selection(state, character):
     elif pending_action(state):
         return False
     elif targeting_enemy(state):
-        return character in enemies(state)
+        return side(state, character) == ENEMY
     elif targeting_friend(state):
-        return character in friends(state)
+        return side(state, character) == FRIEND
     else:
         return False
 
@@ -205,11 +229,14 @@ def next_turn(state):
     )
 
 
+@selector
 def alive_friends(state):
     return model.pyrsistent.pvector(c for c in friends(state) if not c.is_dead)
 
 
 def remove_dead_enemies(state):
+    if not any(e.is_dead for e in enemies(state)):
+        return state
     return set_scene(state, enemies=model.pyrsistent.pvector(
         e for e in enemies(state) if not e.is_dead
     ))
@@ -231,15 +258,11 @@ def on_update(state):
     if active_character(state).is_dead:
         return next_turn(state)
     elif pending_action(state):
-        act = action(state)
-        if action(state).countdown > 0:
-            return set_action(state, act.set(countdown=act.countdown - 1))
-        else:
-            return state
+        return state
     elif all_players_dead(state):
-        return state.set(scene=model.GameOver())
+        return state.enter_scene(model.GameOver())
     elif all_enemies_dead(state):
-        return state.set(scene=state.scene.next_scene)
+        return state.enter_scene(state.scene.next_scene)
     elif is_enemy_turn(state):
         act = random.choice(active_character(state).actions)
         if isinstance(act, model.TargetAction):
@@ -248,7 +271,6 @@ def on_update(state):
         return set_action(
             state,
             action=model.PendingAction(
-                countdown=len(RAMP) - 1,
                 action=act,
                 result=act.apply(state)
             )
@@ -259,6 +281,15 @@ def on_update(state):
         return state
 
 
+@selector
+def player_status(state):
+    '''
+    What draw_player_status shows, as a small tuple to key its layer on.
+    Hashing the Characters themselves costs a noticeable part of a frame.
+    '''
+    return tuple((c.name, c.health, c.max_health) for c in friends(state))
+
+
 def draw_player_status(renderer, state):
     for i, character in enumerate(friends(state)):
         renderer.draw_sprite(
@@ -271,11 +302,14 @@ def draw_player_status(renderer, state):
 
 
 def draw_initiative_tracker(renderer, state):
-    for i, character in reversed(list(enumerate(initiative_order(state)))):
+    order = initiative_order(state)
+    active = active_character(state).entity
+    targeted = target(state).entity if targeting(state) else None
+    for i, character in reversed(list(enumerate(order))):
         xpos = 96 + i * 32
         ypos = 230 - (32 if valid_selection(state, character) else 0)
 
-        if character == active_character(state):
+        if character.entity == active:
             box = Box(xpos - 32, 198, 96, 96)
         else:
             box = Box(xpos, ypos, 64, 64)
@@ -283,13 +317,9 @@ def draw_initiative_tracker(renderer, state):
         if character.health == 0:
             renderer.draw_sprite(DEAD_OVERLAY, box)
 
-        arrow_box = Box(box.x + int(box.w / 2) - 8, box.y - 16, 16, 16)
-        if targeting_enemy(state):
-            if enemies(state)[action(state).target] == character:
-                renderer.draw_sprite(DOWN_ARROW, arrow_box)
-        elif targeting_friend(state):
-            if friends(state)[action(state).target] == character:
-                renderer.draw_sprite(DOWN_ARROW, arrow_box)
+        if character.entity == targeted:
+            arrow_box = Box(box.x + int(box.w / 2) - 8, box.y - 16, 16, 16)
+            renderer.draw_sprite(DOWN_ARROW, arrow_box)
 
 
 def draw_status_header(renderer, text):
@@ -329,9 +359,18 @@ def draw_action_selector(renderer, state):
         renderer.draw_text(MAIN_FONT, line, 100, 60 + i * 12, False)
 
 
+def slide(progress):
+    '''
+    Offset from RAMP at progress 0..1, interpolated between its entries.
+    '''
+    position = (1 - progress) * (len(RAMP) - 1)
+    i = min(int(position), len(RAMP) - 2)
+    return round(RAMP[i] + (RAMP[i + 1] - RAMP[i]) * (position - i))
+
+
 def draw_pending_action(renderer, state):
     act = action(state).action
-    countdown = action(state).countdown
+    offset = 20 + slide(renderer.timeline.tween(action(state), PENDING_SECONDS))
     desc = action(state).result.scene.action.effect_description
     renderer.draw_sprite(
         RIGHT_ARROW,
@@ -340,19 +379,26 @@ def draw_pending_action(renderer, state):
     if hasattr(act, 'character'):
         renderer.draw_sprite(
             CHARACTERS[act.character(state).name],
-            Box(200 - 64 + (20 + RAMP[countdown]), 104 - 64, 128, 128)
+            Box(200 - 64 + offset, 104 - 64, 128, 128)
         )
     renderer.draw_sprite(
         CHARACTERS[active_character(state).name],
-        Box(200 - 64 - (20 + RAMP[countdown]), 104 - 64, 128, 128)
+        Box(200 - 64 - offset, 104 - 64, 128, 128)
     )
     draw_status_header(renderer, act.name)
     renderer.draw_text(MAIN_FONT, desc, 200, 104 + 64 + 12, True)
 
 
-def view(renderer, state):
+def draw_background(renderer, state):
     renderer.draw_sprite(Image(state.scene.background, FULLSCREEN), FULLSCREEN)
     draw_player_status(renderer, state)
+
+
+def view(renderer, state):
+    renderer.draw_layer(
+        ('battle', state.scene.background, player_status(state)),
+        lambda renderer: draw_background(renderer, state)
+    )
     draw_initiative_tracker(renderer, state)
     if targeting(state):
         draw_target_info(renderer, state)
@@ -0,0 +1,809 @@
+import argparse
+import collections
+import glob
+import importlib
+import os
+import random
+import statistics
+import time
+
+import pyxelen
+
+import atlas
+import battle
+import governor
+import headless
+import model
+import profiler
+import selector
+import streaming
+import utils
+
+
+game = importlib.import_module('runia-chronicles')
+
+
+def battle_state(scene, action=None):
+    state = model.initial_model.enter_scene(scene)
+    if action is not None:
+        state = battle.set_action(state, action)
+    return state
+
+
+def pending_state(scene, action):
+    return battle.queue_action(battle_state(scene, action)).clear_effects()
+
+
+SCENARIOS = {
+    'main-menu': model.initial_model,
+    'options': model.initial_model.set(
+        scene=model.Settings(selection=model.SettingsSelection.MUSIC_VOLUME)
+    ),
+    'battle-choose': battle_state(model.RAT_PIRATE_BATTLE),
+    'battle-target-enemy': battle_state(
+        model.RAT_PIRATE_BATTLE, model.SlashAction()
+    ),
+    'battle-target-friend': battle_state(
+        model.RAT_PIRATE_BATTLE, model.StabilizeAction()
+    ),
+    'battle-pending': pending_state(
+        model.RAT_PIRATE_BATTLE, model.SlashAction()
+    ),
+    'battle-enemy-turn': battle_state(model.SKELETON_BATTLE),
+    'cut-scene': model.initial_model.set(scene=model.ACT1),
+    'credits': model.initial_model.set(scene=model.CREDITS),
+    'game-over': model.initial_model.set(scene=model.GameOver()),
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(state, frames, **attributes):
+    '''
+    Run one scenario for the given number of frames. Keyword arguments are
+    set on the EventHandler first, e.g. retained=True or atlas=None.
+    '''
+    platform = headless.Pyxelen()
+    handler = game.EventHandler(platform)
+    handler.retained = False
+    handler.governor = None
+    for name, value in attributes.items():
+        setattr(handler, name, value)
+    calls = platform.window.renderer.calls
+    selector.reset()
+
+    # Start with the music the screen plays, as it would be in a running game
+    handler.state = state
+    state = state.set_music(handler.screen.on_update(state).music)
+
+    # Warm up so first-use loads are not counted against the frame
+    handler.state = state
+    handler.on_update_and_render()
+
+    timings = []
+    submits = []
+    switches = []
+    batches = []
+    copies = []
+    recomputes = []
+    allocations = []
+    for _ in range(frames):
+        handler.state = state
+        before = calls['copy'] + calls['copy_many']
+        switches_before = calls['texture_switch']
+        start = time.perf_counter()
+        handler.on_update_and_render()
+        timings.append(time.perf_counter() - start)
+        submits.append(calls['copy'] + calls['copy_many'] - before)
+        switches.append(calls['texture_switch'] - switches_before)
+        batches.append(handler.batch.last_batches)
+        copies.append(handler.batch.last_copies)
+        recomputes.append(handler.recomputes)
+        allocations.append(handler.allocations)
+    handler.close()
+    return {
+        'fps': frames / sum(timings),
+        'p50': percentile(timings, 0.50) * 1000,
+        'p99': percentile(timings, 0.99) * 1000,
+        'submits': statistics.mean(submits),
+        'switches': statistics.mean(switches),
+        'batches': statistics.mean(batches),
+        'copies': statistics.mean(copies),
+        'selects': statistics.mean(recomputes),
+        'allocs': statistics.mean(allocations),
+        'caches': handler.cache_stats(),
+        'profile': handler.profiler.averages(frames),
+    }
+
+
+COLUMNS = [
+    ('fps', '10.0f'),
+    ('p50', '10.3f'),
+    ('p99', '10.3f'),
+    ('submits', '10.1f'),
+    ('switches', '10.1f'),
+    ('batches', '10.1f'),
+    ('copies', '10.1f'),
+    ('selects', '10.1f'),
+    ('allocs', '10.1f'),
+]
+
+
+def report(results):
+    print(f'{"scenario":<24}' + ''.join(f'{name:>10}' for name, _ in COLUMNS))
+    for scenario, r in results.items():
+        print(
+            f'{scenario:<24}' +
+            ''.join(format(r[name], spec) for name, spec in COLUMNS)
+        )
+
+
+def report_caches(results):
+    print()
+    print(f'{"scenario":<24}{"cache":<12}{"hits":>10}{"misses":>10}{"evicted":>10}{"size":>10}')
+    for scenario, r in results.items():
+        for name, stats in r['caches'].items():
+            print(
+                f'{scenario:<24}{name:<12}{stats["hits"]:>10}{stats["misses"]:>10}'
+                f'{stats["evictions"]:>10}{stats["size"]:>10}'
+            )
+
+
+def scenario_names(args):
+    names = args.scenario or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario {name!r}, choose from {", ".join(SCENARIOS)}')
+    return names
+
+
+def frames_command(args):
+    attributes = {'retained': args.retained}
+    if args.no_atlas:
+        attributes['atlas'] = None
+    results = {
+        name: run_scenario(SCENARIOS[name], args.frames, **attributes)
+        for name in scenario_names(args)
+    }
+    report(results)
+    if args.cache_stats:
+        report_caches(results)
+
+
+def atlas_command(args):
+    if atlas.load() is None:
+        raise SystemExit(f'No usable {atlas.MANIFEST}, run atlas.py first')
+    print(f'{"scenario":<24}{"sheets":>10}{"atlas":>10}{"saved":>10}')
+    for name in scenario_names(args):
+        sheets = run_scenario(SCENARIOS[name], args.frames, atlas=None)
+        packed = run_scenario(SCENARIOS[name], args.frames)
+        print(
+            f'{name:<24}{sheets["switches"]:>10.1f}{packed["switches"]:>10.1f}'
+            f'{sheets["switches"] - packed["switches"]:>10.1f}'
+        )
+
+
+def story_scenes(scene=model.ACT1):
+    while scene is not None:
+        yield scene
+        scene = getattr(scene, 'next_scene', None)
+
+
+def scene_name(scene):
+    for name, value in vars(model).items():
+        if value is scene:
+            return name
+    return type(scene).__name__
+
+
+def run_story(frames, load_rate, preload, playthroughs=1):
+    '''
+    Walk through every scene of the story, idling for a number of frames on
+    each one, and time the first frame after every scene change.
+    '''
+    platform = headless.Pyxelen(load_rate)
+    handler = game.EventHandler(platform)
+    handler.governor = None
+    if not preload:
+        handler.preloader.depth = 0
+    handler.on_update_and_render()
+
+    first_frames = {}
+    for _ in range(playthroughs):
+        for scene in story_scenes():
+            handler.state = handler.state.enter_scene(scene)
+            start = time.perf_counter()
+            handler.on_update_and_render()
+            first_frames[scene_name(scene)] = (time.perf_counter() - start) * 1000
+            platform.run(handler, 30, frames)
+    handler.close()
+    return first_frames, handler
+
+
+def story_command(args):
+    cold, cold_handler = run_story(args.frames, args.load_rate, preload=False)
+    warm, warm_handler = run_story(args.frames, args.load_rate, preload=True)
+    cold_stats = cold_handler.preloader.stats()
+    warm_stats = warm_handler.preloader.stats()
+    print(f'{"scene":<24}{"no preload":>12}{"preload":>12}')
+    for name in cold:
+        print(f'{name:<24}{cold[name]:>12.1f}{warm[name]:>12.1f}')
+    print()
+    print(f'{"":<24}{"hits":>12}{"stalls":>12}')
+    print(f'{"no preload":<24}{cold_stats["hits"]:>12}{cold_stats["stalls"]:>12}')
+    print(f'{"preload":<24}{warm_stats["hits"]:>12}{warm_stats["stalls"]:>12}')
+    report_resources(warm_handler)
+
+
+def report_resources(handler):
+    preloaded = handler.preloader.stats()
+    print()
+    print(
+        f'{"resource":<24}{"current":>12}{"peak":>12}{"budget":>12}{"evicted":>12}'
+        f'{"preloaded":>12}'
+    )
+    for kind, stats in handler.resources.stats().items():
+        print(
+            f'{kind:<24}{stats["weight"] / 1024:>11.0f}K{stats["peak"] / 1024:>11.0f}K'
+            f'{stats["budget"] / 1024:>11.0f}K{stats["evictions"]:>12}'
+            f'{preloaded["held"].get(kind, 0) / 1024:>11.0f}K'
+        )
+    print(
+        f'preloader: {preloaded["ready"]} handles ready, {preloaded["dropped"]} dropped unclaimed,'
+        f' {preloaded["hits"]} hits, {preloaded["stalls"]} stalls'
+    )
+
+
+def soak_command(args):
+    _, handler = run_story(args.frames, None, preload=True, playthroughs=args.playthroughs)
+    report_resources(handler)
+
+
+def audio_command(args):
+    '''
+    Scroll the main menu twice every few frames, which queues two blips in
+    the same frame, and compare the audio calls a naive frame would make
+    with the calls the mixer sends.
+    '''
+    platform = headless.Pyxelen()
+    handler = game.EventHandler(platform)
+    handler.governor = None
+    for frame in range(args.frames):
+        if frame % args.every == 0:
+            platform.key_down(handler, pyxelen.Key.DOWN)
+            platform.key_down(handler, pyxelen.Key.DOWN)
+        handler.on_update_and_render()
+    handler.close()
+    stats = handler.mixer.stats()
+    seconds = args.frames / 30
+    print(f'{"":<12}{"calls":>10}{"per second":>12}')
+    print(f'{"before":<12}{stats["requested"]:>10}{stats["requested"] / seconds:>12.1f}')
+    print(f'{"after":<12}{stats["sent"]:>10}{stats["sent"] / seconds:>12.1f}')
+
+
+DICE = [
+    (1, 6, 0, 0),
+    (1, 6, 2, 0),
+    (1, 10, 2, 0),
+    (1, 10, 0, 1),
+    (2, 6, 0, 0),
+    (1, 20, 0, 1),
+]
+
+
+def dice_command(args):
+    '''
+    Time the scalar and batched dice for the rolls the actions use, and
+    compare their outcome histograms by total variation distance.
+    '''
+    import dice
+
+    rng = dice.generator(args.seed)
+    random.seed(args.seed)
+    print(
+        f'{"roll":<16}{"scalar/s":>12}{"batched/s":>12}{"speedup":>10}'
+        f'{"scalar avg":>12}{"batch avg":>12}{"tv dist":>10}'
+    )
+    for quantity, size, advantage, disadvantage in DICE:
+        start = time.perf_counter()
+        scalar = [
+            utils.roll(quantity, size, advantage, disadvantage)
+            for _ in range(args.rolls)
+        ]
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = dice.rolls(args.rolls, quantity, size, advantage, disadvantage, rng)
+        batched_time = time.perf_counter() - start
+
+        scalar_counts = collections.Counter(scalar)
+        batched_counts = collections.Counter(batched.tolist())
+        distance = sum(
+            abs(scalar_counts[k] - batched_counts[k])
+            for k in scalar_counts.keys() | batched_counts.keys()
+        ) / (2 * args.rolls)
+
+        name = f'{quantity}d{size} +{advantage}/-{disadvantage}'
+        print(
+            f'{name:<16}{args.rolls / scalar_time:>12.0f}{args.rolls / batched_time:>12.0f}'
+            f'{scalar_time / batched_time:>9.1f}x'
+            f'{statistics.mean(scalar):>12.3f}{batched.mean():>12.3f}{distance:>10.4f}'
+        )
+
+
+def distributions_command(args):
+    '''
+    Check the exact roll distributions against Monte Carlo samples from the
+    batched dice and time cold and memoised queries.
+    '''
+    import numpy
+
+    import dice
+    import distributions
+
+    rng = dice.generator(args.seed)
+    print(
+        f'{"roll":<16}{"exact avg":>10}{"mc avg":>10}{"exact hit":>10}{"mc hit":>10}'
+        f'{"tv dist":>10}{"cold us":>10}{"warm us":>10}'
+    )
+    for roll in DICE:
+        start = time.perf_counter()
+        pmf = distributions.roll_pmf(*roll)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        distributions.roll_pmf(*roll)
+        warm = time.perf_counter() - start
+
+        samples = dice.rolls(args.rolls, *roll, rng=rng)
+        counts = numpy.bincount(samples, minlength=len(pmf)) / args.rolls
+        exact = numpy.zeros(len(counts))
+        exact[:len(pmf)] = pmf
+        distance = numpy.abs(counts - exact).sum() / 2
+
+        quantity, size, advantage, disadvantage = roll
+        name = f'{quantity}d{size} +{advantage}/-{disadvantage}'
+        print(
+            f'{name:<16}{distributions.expected(pmf):>10.3f}{samples.mean():>10.3f}'
+            f'{distributions.hit_chance(*roll):>10.4f}'
+            f'{(samples >= distributions.THRESHOLD).mean():>10.4f}'
+            f'{distance:>10.4f}{cold * 1e6:>10.0f}{warm * 1e6:>10.2f}'
+        )
+
+
+def music_audio():
+    # The real backend if there is an audio device, else None
+    try:
+        pyxelen.init()
+        return pyxelen.Pyxelen().audio
+    except Exception:
+        return None
+
+
+def music_command(args):
+    '''
+    Time to the first playable sample and resident size of each track,
+    decoded whole against streamed through the ring buffer. Uses the real
+    decoder, so needs soundfile.
+    '''
+    if streaming.soundfile is None:
+        print('music needs soundfile, the optional streaming decoder, which is not installed')
+        return
+    audio = music_audio()
+    if audio is None:
+        print('no audio backend, pyxelen load_music not timed')
+    elif not streaming.supported(audio):
+        print('this audio backend has no open_stream, so the game plays tracks whole')
+    print(
+        f'{"track":<36}{"load ms":>10}{"decode ms":>10}{"stream ms":>10}'
+        f'{"PCM KB":>10}{"ring KB":>10}'
+    )
+    for filename in sorted(glob.glob('music/*.ogg')):
+        # pyxelen.audio.load_music, what the game does without streaming
+        loaded = None
+        if audio is not None:
+            start = time.perf_counter()
+            audio.load_music(filename)
+            loaded = (time.perf_counter() - start) * 1000
+
+        # Decoding the whole track to PCM up front
+        start = time.perf_counter()
+        decoder = streaming.SoundFileDecoder(filename)
+        while decoder.read():
+            pass
+        whole = (time.perf_counter() - start) * 1000
+        pcm = decoder.decoded_bytes
+        decoder.close()
+
+        # Opening the track and decoding the first chunk, after which
+        # MusicStream starts playing
+        start = time.perf_counter()
+        decoder = streaming.SoundFileDecoder(filename)
+        decoder.read()
+        streamed = (time.perf_counter() - start) * 1000
+        decoder.close()
+
+        print(
+            f'{os.path.basename(filename):<36}'
+            f'{"-" if loaded is None else format(loaded, ".1f"):>10}'
+            f'{whole:>10.1f}{streamed:>10.1f}'
+            f'{pcm / 1024:>10.0f}{streaming.BUFFER_BYTES / 1024:>10.0f}'
+        )
+
+
+def time_per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls
+
+
+def compact_command(args):
+    '''
+    Time each Action.apply, with the model.Record objects it allocates,
+    against its compact equivalent (on a fresh copy, so both sides produce a
+    new state), then whole simulated battles on both engines. Seeded battles
+    must come out the same on both.
+
+    A Stabilize on a living target is a no-op that returns the same Model,
+    so its compact time is all copy(). Greedy battles include the policy,
+    which costs the same on both engines and so caps their speedup.
+    '''
+    import compact
+    import simulate
+
+    state = model.initial_model.enter_scene(model.SKELETON_BATTLE)
+    combat = compact.CompactBattle.from_model(state)
+    print(f'{"action":<24}{"model us":>10}{"allocs":>8}{"compact us":>12}{"speedup":>10}')
+    for action in compact.ACTIONS:
+        act = action(target=0) if issubclass(action, model.TargetAction) else action()
+        action_id = compact.ACTION_IDS[action]
+        random.seed(args.seed)
+        allocations = model.allocation_count()
+        model_time = time_per_call(lambda: act.apply(state), args.calls)
+        allocations = (model.allocation_count() - allocations) / args.calls
+        random.seed(args.seed)
+        compact_time = time_per_call(
+            lambda: compact.apply(combat.copy(), action_id), args.calls
+        )
+        print(
+            f'{action.__name__:<24}{model_time * 1e6:>10.1f}{allocations:>8.1f}'
+            f'{compact_time * 1e6:>12.1f}'
+            f'{model_time / compact_time:>9.1f}x'
+        )
+
+    print()
+    print(f'{"battle":<20}{"policy":<8}{"model/s":>10}{"compact/s":>11}{"speedup":>10}  same')
+    seeds = range(args.seed, args.seed + args.battles)
+    for name in args.battle or ['RAT_BATTLE', 'SKELETON_BATTLE', 'FINAL_BATTLE']:
+        for policy in simulate.POLICIES:
+            timings = {}
+            results = {}
+            for engine in ('model', 'compact'):
+                start = time.perf_counter()
+                results[engine] = simulate.fight_many(name, policy, engine, seeds)
+                timings[engine] = time.perf_counter() - start
+            print(
+                f'{name:<20}{policy:<8}{args.battles / timings["model"]:>10.0f}'
+                f'{args.battles / timings["compact"]:>11.0f}'
+                f'{timings["model"] / timings["compact"]:>9.1f}x'
+                f'  {results["model"] == results["compact"]}'
+            )
+
+
+def run_timestep(seconds, fps, tick_rate=None, render_rate=None, stall_every=0,
+                 stall=0.2):
+    '''
+    Run the battle on a fake clock for the given number of seconds. The
+    loop runs at fps, and every stall_every-th frame takes stall seconds.
+    '''
+    now = [0.0]
+    clock = lambda: now[0]
+    platform = headless.Pyxelen()
+    handler = game.EventHandler(platform)
+    handler.clock = handler.timeline.clock = clock
+    handler.governor = None
+    handler.tick_rate = tick_rate
+    handler.render_rate = render_rate
+    handler.state = SCENARIOS['battle-choose']
+    frames = 0
+    while now[0] < seconds:
+        handler.on_update_and_render()
+        frames += 1
+        if stall_every and frames % stall_every == 0:
+            now[0] += stall
+        else:
+            now[0] += 1 / fps
+    handler.close()
+    return {
+        'frames': frames / now[0],
+        'ticks': handler.ticks / now[0],
+        'drawn': (frames - handler.frames_skipped) / now[0],
+        'dropped': handler.dropped_ticks,
+    }
+
+
+def timestep_command(args):
+    '''
+    Game updates per second with one update per frame and with a fixed
+    tick, at different frame rates and with stalled frames.
+    '''
+    loops = [
+        ('30 fps', dict(fps=30)),
+        ('60 fps', dict(fps=60)),
+        ('120 fps', dict(fps=120)),
+        ('120 fps, draw 60', dict(fps=120, render_rate=60)),
+        ('15 fps', dict(fps=15)),
+        ('30 fps, draw 10', dict(fps=30, render_rate=10)),
+        ('10 fps', dict(fps=10)),
+        ('60 fps, stalls', dict(fps=60, stall_every=30)),
+        ('30 fps, long stalls', dict(fps=30, stall_every=30, stall=0.5)),
+    ]
+    print(f'{"loop":<24}{"mode":<12}{"frames/s":>10}{"drawn/s":>10}{"ticks/s":>10}{"dropped":>10}')
+    for name, loop in loops:
+        for mode, tick_rate in (('per frame', None), (f'{args.tick_rate:g} Hz', args.tick_rate)):
+            r = run_timestep(args.seconds, tick_rate=tick_rate, **loop)
+            print(
+                f'{name:<24}{mode:<12}{r["frames"]:>10.1f}{r["drawn"]:>10.1f}'
+                f'{r["ticks"]:>10.1f}{r["dropped"]:>10}'
+            )
+
+
+def idle_command(args):
+    '''
+    Sit on each screen on a fake clock, pressing UP every --press seconds,
+    and count the frames that did work.
+    '''
+    print(
+        f'{"scenario":<24}{"frames":>8}{"worked":>8}{"saved":>8}{"wake":>6}  '
+        + '  '.join(name for name, _ in governor.Governor().report())
+    )
+    for name in scenario_names(args):
+        now = [0.0]
+        platform = headless.Pyxelen()
+        handler = game.EventHandler(platform)
+        handler.clock = handler.timeline.clock = handler.governor.clock = lambda: now[0]
+        handler.state = SCENARIOS[name]
+        frames = int(args.seconds * game.FPS)
+        press = int(args.press * game.FPS)
+        wake = 0
+        for frame in range(frames):
+            if press and frame and frame % press == 0:
+                platform.key_down(handler, pyxelen.Key.UP)
+                idle = handler.frames_idle
+                handler.on_update_and_render()
+                # Frames skipped right after input, should be 0
+                wake = max(wake, handler.frames_idle - idle)
+            else:
+                handler.on_update_and_render()
+            now[0] += 1 / game.FPS
+        handler.close()
+        worked = frames - handler.frames_idle
+        tiers = '  '.join(
+            f'{seconds:>{len(tier)}.1f}' for tier, seconds in handler.governor.report()
+        )
+        print(
+            f'{name:<24}{frames:>8}{worked:>8}{1 - worked / frames:>8.0%}{wake:>6}  {tiers}'
+        )
+
+
+def run_threaded(seconds, threaded, tick_rate, present_time, press):
+    platform = headless.Pyxelen()
+    handler = game.EventHandler(platform)
+    handler.governor = None
+    handler.state = SCENARIOS['battle-choose']
+    platform.window.renderer.present_time = present_time
+    if threaded:
+        handler.start_simulation(tick_rate)
+    start = time.perf_counter()
+    next_press = start + press
+    frames = 0
+    while time.perf_counter() - start < seconds:
+        if time.perf_counter() >= next_press:
+            # Works through choose, target, pending and the enemy turns
+            platform.key_down(handler, pyxelen.Key.RETURN)
+            next_press += press
+        handler.on_update_and_render()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    ticks = handler.simulation.ticks if threaded else handler.ticks
+    handler.close()
+    latencies = sorted(handler.input_latencies)
+    return {
+        'frames': frames / elapsed,
+        'ticks': ticks / elapsed,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def threaded_command(args):
+    '''
+    Frames and game updates per second, and key press to present latency,
+    with the game rules on the platform thread and on their own thread.
+    The loop runs flat out. present() blocks for --present-ms, as a GPU
+    would, which is when the other thread gets to run.
+    '''
+    print(f'cores {os.cpu_count()}')
+    print(f'{"mode":<24}{"frames/s":>10}{"ticks/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for present_ms in args.present_ms:
+        for threaded in (False, True):
+            r = run_threaded(
+                args.seconds, threaded, args.tick_rate, present_ms / 1000, args.press
+            )
+            mode = f'{"threaded" if threaded else "serial"}, present {present_ms:g}ms'
+            print(
+                f'{mode:<24}{r["frames"]:>10.1f}{r["ticks"]:>10.1f}'
+                f'{r["p50"]:>10.2f}{r["p99"]:>10.2f}'
+            )
+
+
+def profiler_command(args):
+    '''
+    Frame time with the profiler off and on, and where the time goes by
+    the profiler's own account.
+    '''
+    print(
+        f'{"scenario":<24}{"off p50":>10}{"on p50":>10}'
+        + ''.join(f'{phase:>10}' for phase in profiler.PHASES)
+    )
+    for name in scenario_names(args):
+        off = run_scenario(SCENARIOS[name], args.frames)
+        on = run_scenario(SCENARIOS[name], args.frames, profiling=True)
+        print(
+            f'{name:<24}{off["p50"]:>10.3f}{on["p50"]:>10.3f}'
+            + ''.join(f'{on["profile"][phase] * 1000:>10.3f}' for phase in profiler.PHASES)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runia Chronicles benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    frames = commands.add_parser('frames', help='per-screen frame timings')
+    frames.add_argument('--frames', type=int, default=300)
+    frames.add_argument(
+        '--retained', action='store_true',
+        help='re-present unchanged frames instead of redrawing them'
+    )
+    frames.add_argument(
+        '--no-atlas', action='store_true',
+        help='draw from the original sprite sheets'
+    )
+    frames.add_argument(
+        '--cache-stats', action='store_true',
+        help='also print text cache counters'
+    )
+    frames.add_argument(
+        'scenario', nargs='*',
+        help='scenarios to run (default: all)'
+    )
+    frames.set_defaults(func=frames_command)
+
+    switches = commands.add_parser(
+        'atlas', help='texture switches per frame with and without the atlas'
+    )
+    switches.add_argument('--frames', type=int, default=100)
+    switches.add_argument(
+        'scenario', nargs='*',
+        help='scenarios to run (default: all)'
+    )
+    switches.set_defaults(func=atlas_command)
+
+    story = commands.add_parser(
+        'story', help='first-frame time after each scene change, with and without preloading'
+    )
+    story.add_argument(
+        '--frames', type=int, default=10,
+        help='frames to idle on each scene'
+    )
+    story.add_argument(
+        '--load-rate', type=float, default=20e6,
+        help='simulated asset decode speed in bytes per second'
+    )
+    story.set_defaults(func=story_command)
+
+    soak = commands.add_parser(
+        'soak', help='resource usage after several playthroughs'
+    )
+    soak.add_argument('--frames', type=int, default=3)
+    soak.add_argument('--playthroughs', type=int, default=5)
+    soak.set_defaults(func=soak_command)
+
+    sound = commands.add_parser(
+        'audio', help='audio backend calls per second with and without the mixer'
+    )
+    sound.add_argument('--frames', type=int, default=300)
+    sound.add_argument(
+        '--every', type=int, default=10,
+        help='frames between double key presses'
+    )
+    sound.set_defaults(func=audio_command)
+
+    rolls = commands.add_parser(
+        'dice', help='scalar vs batched NumPy dice rolls'
+    )
+    rolls.add_argument('--rolls', type=int, default=200000)
+    rolls.add_argument('--seed', type=int, default=0)
+    rolls.set_defaults(func=dice_command)
+
+    exact = commands.add_parser(
+        'distributions', help='exact roll distributions vs Monte Carlo'
+    )
+    exact.add_argument('--rolls', type=int, default=1000000)
+    exact.add_argument('--seed', type=int, default=0)
+    exact.set_defaults(func=distributions_command)
+
+    music = commands.add_parser(
+        'music', help='time to first sample and resident size, whole track vs streaming'
+    )
+    music.set_defaults(func=music_command)
+
+    combat = commands.add_parser(
+        'compact', help='PClass Model vs compact combat state'
+    )
+    combat.add_argument('--calls', type=int, default=5000)
+    combat.add_argument('--battles', type=int, default=100)
+    combat.add_argument('--seed', type=int, default=0)
+    combat.add_argument(
+        'battle', nargs='*',
+        help='model.Battle constants to simulate (default: a few)'
+    )
+    combat.set_defaults(func=compact_command)
+
+    timestep = commands.add_parser(
+        'timestep', help='game speed per frame rate, per-frame vs fixed tick'
+    )
+    timestep.add_argument('--seconds', type=float, default=10)
+    timestep.add_argument('--tick-rate', type=float, default=30)
+    timestep.set_defaults(func=timestep_command)
+
+    idle = commands.add_parser(
+        'idle', help='frames the idle governor saves on static screens'
+    )
+    idle.add_argument('--seconds', type=float, default=60)
+    idle.add_argument(
+        '--press', type=float, default=20,
+        help='seconds between key presses, 0 for none'
+    )
+    idle.add_argument(
+        'scenario', nargs='*',
+        help='scenarios to run (default: all)'
+    )
+    idle.set_defaults(func=idle_command)
+
+    thread = commands.add_parser(
+        'threaded', help='game rules on the platform thread vs their own thread'
+    )
+    thread.add_argument('--seconds', type=float, default=5)
+    thread.add_argument('--tick-rate', type=float, default=60)
+    thread.add_argument(
+        '--press', type=float, default=0.25,
+        help='seconds between RETURN presses'
+    )
+    thread.add_argument(
+        '--present-ms', type=float, nargs='+', default=[0, 4, 16],
+        help='time present() blocks for'
+    )
+    thread.set_defaults(func=threaded_command)
+
+    profile = commands.add_parser(
+        'profiler', help='frame time with the profiler off and on'
+    )
+    profile.add_argument('--frames', type=int, default=300)
+    profile.add_argument(
+        'scenario', nargs='*',
+        help='scenarios to run (default: all)'
+    )
+    profile.set_defaults(func=profiler_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import collections
+
+
+class LRUCache:
+    '''
+    Least-recently-used cache bounded by the total weight of its entries.
+    Every entry weighs 1 unless a weigh function is given, in which case the
+    budget can be a byte count or any other measure. Pinned keys are never
+    evicted, so the cache can go over budget if everything left is pinned.
+    '''
+
+    def __init__(self, budget, weigh=None):
+        self.budget = budget
+        self.weigh = weigh or (lambda value: 1)
+        self.entries = collections.OrderedDict()
+        self.weights = {}
+        self.weight = 0
+        self.peak = 0
+        self.pinned = frozenset()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, factory):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = factory()
+            self.put(key, value)
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, weight=None):
+        self.discard(key)
+        if weight is None:
+            weight = self.weigh(value)
+        self.entries[key] = value
+        self.weights[key] = weight
+        self.weight += weight
+        self.peak = max(self.peak, self.weight)
+        # Never evict the entry just added, even if it is over budget alone
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        if self.weight <= self.budget:
+            return
+        for key in list(self.entries):
+            if self.weight <= self.budget:
+                return
+            if key != keep and key not in self.pinned:
+                self.discard(key)
+                self.evictions += 1
+
+    def pin(self, keys):
+        self.pinned = frozenset(keys)
+        self.evict()
+
+    def discard(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.weight -= self.weights.pop(key)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'weight': self.weight,
+            'peak': self.peak,
+            'budget': self.budget,
+            'pinned': len(self.pinned & self.entries.keys()),
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.weights.clear()
+        self.weight = 0
@@ -0,0 +1,363 @@
+'''
+Compact struct-of-arrays combat state for simulations and AI search.
+
+A CompactBattle keeps one list per attribute (health, max health, size
+code, action IDs) indexed by combatant, friends first and enemies after,
+plus the initiative cursor. Applying an action changes a few list entries
+instead of rebuilding Character, Battle and Model objects.
+
+from_model() and to_model() convert losslessly, and APPLY has a function
+for every Action class in model.py. The functions draw from the random
+module in the same order as Action.apply and utils.roll, so a seeded
+simulation gives the same results on either representation.
+'''
+import random
+
+import model
+
+
+SIZES = ['Small', 'Medium', 'Large']
+SMALL, MEDIUM, LARGE = range(len(SIZES))
+
+ACTIONS = [
+    model.KickAction,
+    model.SlashAction,
+    model.SummonAction,
+    model.FireballAction,
+    model.FireboltAction,
+    model.PunchAction,
+    model.EngulfAction,
+    model.CongealAction,
+    model.BiteAction,
+    model.ThunderCannonAction,
+    model.HealAction,
+    model.StabilizeAction,
+]
+ACTION_IDS = {action: i for i, action in enumerate(ACTIONS)}
+
+
+# Bound to the module's shared Random, which random.seed() reseeds in place
+getrandbits = random.getrandbits
+
+
+def die(size):
+    # random.randint(1, size) without its argument checks. This copies
+    # CPython's private Random._randbelow (rejection sampling over
+    # getrandbits), which is what keeps compact battles identical to the
+    # model ones. Another interpreter or a change to _randbelow would break
+    # that without an error; test_compact.py checks it still holds.
+    bits = size.bit_length()
+    r = getrandbits(bits)
+    while r >= size:
+        r = getrandbits(bits)
+    return r + 1
+
+
+def explode_roll(quantity, size, advantage=0, disadvantage=0):
+    '''
+    utils.explode_roll on die().
+    '''
+    advantage -= disadvantage
+    total = 0
+    if quantity == 1 and advantage:
+        # One die kept, the highest or lowest, without sorting
+        dice = [die(size) for _ in range(1 + abs(advantage))]
+        kept = max(dice) if advantage > 0 else min(dice)
+        if kept != size:
+            return kept
+        total = kept
+        advantage = 0
+    if quantity == 1 and not advantage:
+        # The usual case, one die with no lists to build
+        bits = size.bit_length()
+        while True:
+            r = getrandbits(bits)
+            while r >= size:
+                r = getrandbits(bits)
+            total += r + 1
+            if r + 1 != size:
+                return total
+    if advantage:
+        dice = sorted([die(size) for _ in range(quantity + abs(advantage))])
+        kept = dice[-quantity:] if advantage > 0 else dice[:quantity]
+        total += sum(kept)
+        quantity = kept.count(size)
+    while quantity:
+        # Several dice, summed as they are rolled rather than listed
+        exploded = 0
+        for _ in range(quantity):
+            r = die(size)
+            total += r
+            if r == size:
+                exploded += 1
+        quantity = exploded
+    return total
+
+
+def roll(quantity, size, advantage=0, disadvantage=0):
+    return explode_roll(1, 20) + explode_roll(quantity, size, advantage, disadvantage)
+
+
+class CompactBattle:
+    __slots__ = (
+        'state', 'characters', 'index', 'entity', 'health', 'max_health', 'size',
+        'actions', 'friends', 'initiative', 'description',
+    )
+
+    def __init__(self, state, characters, friends):
+        self.state = state
+        self.characters = characters
+        self.index = [c.index for c in characters]
+        self.entity = [c.entity for c in characters]
+        self.health = [c.health for c in characters]
+        self.max_health = [c.max_health for c in characters]
+        self.size = [SIZES.index(c.size) for c in characters]
+        self.actions = [
+            tuple(ACTION_IDS[type(a)] for a in c.actions)
+            for c in characters
+        ]
+        self.friends = friends
+        self.initiative = state.scene.initiative
+        self.description = state.scene.action.effect_description
+
+    @classmethod
+    def from_model(cls, state):
+        friends = state.characters
+        return cls(state, list(friends) + list(state.scene.enemies), len(friends))
+
+    def copy(self):
+        other = object.__new__(CompactBattle)
+        other.state = self.state
+        other.characters = self.characters[:]
+        other.index = self.index[:]
+        other.entity = self.entity[:]
+        other.health = self.health[:]
+        other.max_health = self.max_health[:]
+        other.size = self.size[:]
+        other.actions = self.actions[:]
+        other.friends = self.friends
+        other.initiative = self.initiative
+        other.description = self.description
+        return other
+
+    def to_model(self):
+        characters = [
+            c if c.health == h and c.index == i and c.entity == e
+            else c.set(health=h, index=i, entity=e)
+            for c, i, e, h in zip(self.characters, self.index, self.entity, self.health)
+        ]
+        state = self.state
+        scene = state.scene
+        friends = characters[:self.friends]
+        enemies = characters[self.friends:]
+        if any(a is not b for a, b in zip(friends, state.characters)):
+            state = state.set(characters=friends)
+        changes = {}
+        if len(enemies) != len(scene.enemies) or any(
+            a is not b for a, b in zip(enemies, scene.enemies)
+        ):
+            changes['enemies'] = enemies
+        if self.initiative != scene.initiative:
+            changes['initiative'] = self.initiative
+        if self.description != scene.action.effect_description:
+            changes['action'] = scene.action.set(effect_description=self.description)
+        if changes:
+            state = state.set(scene=scene.set(**changes))
+        return state
+
+    # Sides are ranges of indexes into the attribute lists
+
+    @property
+    def friend_indexes(self):
+        return range(self.friends)
+
+    @property
+    def enemy_indexes(self):
+        return range(self.friends, len(self.health))
+
+    def is_dead(self, i):
+        return self.health[i] <= 0
+
+    def order(self):
+        everyone = list(range(len(self.health)))
+        cut = self.initiative
+        return everyone[cut:] + everyone[:cut]
+
+    def active(self):
+        # order()[0] without building it. The cursor can be past the end
+        # after enemies are removed, which starts the order over.
+        if self.initiative < len(self.health):
+            return self.initiative
+        return 0
+
+    def upcoming(self):
+        '''
+        order()[1], or order()[0] if there is only one combatant.
+        '''
+        n = len(self.health)
+        active = self.initiative if self.initiative < n else 0
+        return (active + 1) % n
+
+    def is_enemy(self, i):
+        return i >= self.friends
+
+    def next_turn(self):
+        self.initiative = (self.initiative + 1) % len(self.health)
+
+    def remove_dead_enemies(self):
+        # Runs every turn, usually with nobody to remove
+        if min(self.health[self.friends:], default=1) > 0:
+            return
+        alive = [i for i in range(len(self.health)) if i < self.friends or self.health[i] > 0]
+        if len(alive) == len(self.health):
+            return
+        for name in ('characters', 'index', 'entity', 'health', 'max_health', 'size', 'actions'):
+            values = getattr(self, name)
+            setattr(self, name, [values[i] for i in alive])
+
+    def add(self, character, index, entity):
+        self.characters.append(character)
+        self.index.append(index)
+        self.entity.append(entity)
+        self.health.append(character.health)
+        self.max_health.append(character.max_health)
+        self.size.append(SIZES.index(character.size))
+        self.actions.append(tuple(ACTION_IDS[type(a)] for a in character.actions))
+
+
+def resolve(battle, side, target):
+    # TargetAction.character falls back to the last one when out of range
+    if len(side) > target:
+        return side[target]
+    else:
+        return side[len(side) - 1]
+
+
+def damage(battle, i, amount):
+    amount -= 10
+    if amount < 0:
+        amount = 0
+        battle.description = 'Missed'
+    else:
+        if amount < 3:
+            amount = 3
+        battle.description = f'Did {amount} Damage'
+    battle.health[i] = max(0, battle.health[i] - amount)
+
+
+def heal(battle, i, amount):
+    amount -= 10
+    if amount < 0:
+        amount = 0
+        battle.description = 'Fizzled'
+    else:
+        if amount < 3:
+            amount = 3
+        battle.description = f'Did {amount} Healing'
+    battle.health[i] = min(battle.max_health[i], battle.health[i] + amount)
+
+
+def kick(battle, target):
+    i = resolve(battle, battle.enemy_indexes, target)
+    size = battle.size[i]
+    if size == SMALL:
+        amount = roll(1, 6, advantage=2)
+    elif size == LARGE:
+        amount = explode_roll(1, 20, disadvantage=1)
+    elif size == MEDIUM:
+        amount = roll(1, 6)
+    else:
+        amount = 0
+    damage(battle, i, amount)
+
+
+def slash(battle, target):
+    damage(battle, resolve(battle, battle.enemy_indexes, target), roll(1, 10, advantage=2))
+
+
+def summon(battle, target):
+    model.SUMMON_INDEX += 1
+    battle.description = 'Summoned a Skeleton Minion'
+    battle.add(model.SKELETON_1, model.SUMMON_INDEX, model.new_entity())
+
+
+def fireball(battle, target):
+    total_damage = 0
+    for i in battle.enemy_indexes:
+        raw_damage = roll(1, 10, disadvantage=1) - 10
+        if raw_damage < 0:
+            amount = 0
+        elif raw_damage < 3:
+            amount = 3
+        else:
+            amount = raw_damage
+        battle.health[i] = max(0, battle.health[i] - amount)
+        total_damage += amount
+    battle.description = f'Did {total_damage} Damage'
+
+
+def firebolt(battle, target):
+    damage(battle, resolve(battle, battle.enemy_indexes, target), roll(1, 10))
+
+
+def punch(battle, target):
+    damage(battle, resolve(battle, battle.friend_indexes, target), roll(1, 6))
+
+
+def engulf(battle, target):
+    damage(battle, resolve(battle, battle.friend_indexes, target), roll(2, 6))
+
+
+def congeal(battle, target):
+    for i in battle.enemy_indexes:
+        battle.health[i] += 10
+    battle.description = 'Congealed with other Oozes to Solidify'
+
+
+def bite(battle, target):
+    damage(battle, resolve(battle, battle.friend_indexes, target), roll(1, 4))
+
+
+def thunder_cannon(battle, target):
+    damage(battle, resolve(battle, battle.enemy_indexes, target), roll(2, 6))
+
+
+def heal_action(battle, target):
+    heal(battle, resolve(battle, battle.friend_indexes, target), roll(1, 4))
+
+
+def stabilize(battle, target):
+    i = resolve(battle, battle.friend_indexes, target)
+    if battle.is_dead(i):
+        heal(battle, i, 11)
+
+
+APPLY = {
+    model.KickAction: kick,
+    model.SlashAction: slash,
+    model.SummonAction: summon,
+    model.FireballAction: fireball,
+    model.FireboltAction: firebolt,
+    model.PunchAction: punch,
+    model.EngulfAction: engulf,
+    model.CongealAction: congeal,
+    model.BiteAction: bite,
+    model.ThunderCannonAction: thunder_cannon,
+    model.HealAction: heal_action,
+    model.StabilizeAction: stabilize,
+}
+APPLY_BY_ID = [APPLY[action] for action in ACTIONS]
+
+
+def apply(battle, action_id, target=0):
+    APPLY_BY_ID[action_id](battle, target)
+
+
+def select_target(battle):
+    friendlies = [
+        (i, c)
+        for i, c in zip(range(100), battle.friend_indexes)
+        if not battle.is_dead(c)
+    ]
+    index, _ = random.choice(friendlies)
+    return index
@@ -1,6 +1,8 @@
 import model
 import pyxelen
 
+from selector import selector
+
 from view import *
 from sounds import *
 from utils import *
@@ -10,6 +12,7 @@ def dialog(state):
     return state.scene.dialog
 
 
+@selector
 def current(state):
     return dialog(state)[0]
 
@@ -35,10 +38,7 @@ def on_key_down(key, state):
                 characters = model.CHARACTERS
             else:
                 characters = state.characters
-            return state.set(
-                scene=next_scene(state),
-                characters=characters
-            )
+            return state.enter_scene(next_scene(state), characters=characters)
     else:
         return state
 
@@ -47,7 +47,7 @@ def on_update(state):
     return state.set_music(state.scene.music)
 
 
-def view(renderer, state):
+def draw_page(renderer, state):
     renderer.draw_sprite(Image(state.scene.background, FULLSCREEN), FULLSCREEN)
     image = current(state).image
     if image != '':
@@ -56,3 +56,10 @@ def view(renderer, state):
     renderer.draw_text(MAIN_FONT, speaker(state), 42, 71, True)
     for i, line in enumerate(lines(state)):
         renderer.draw_text(MAIN_FONT, line, 100, 25 + i * 12, False)
+
+
+def view(renderer, state):
+    renderer.draw_layer(
+        ('cut scene', state.scene.background, current(state)),
+        lambda renderer: draw_page(renderer, state)
+    )
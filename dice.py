@@ -0,0 +1,72 @@
+'''
+Batched versions of utils.explode_roll and utils.roll for simulations.
+
+Each function rolls `count` independent rolls at once and returns a NumPy
+array. The parameters can be scalars or arrays of length `count`, so one
+call can mix different dice. The distribution is the same as the scalar
+functions: advantage keeps the highest dice, disadvantage the lowest, and
+every kept maximum roll adds another exploding die.
+'''
+import numpy
+
+
+def generator(rng=None):
+    if isinstance(rng, numpy.random.Generator):
+        return rng
+    return numpy.random.default_rng(rng)
+
+
+def explode_rolls(count, quantity, size, advantage=0, disadvantage=0, rng=None):
+    rng = generator(rng)
+    quantity = numpy.broadcast_to(numpy.asarray(quantity, dtype=numpy.int64), (count,))
+    size = numpy.broadcast_to(numpy.asarray(size, dtype=numpy.int64), (count,))
+    advantage = numpy.broadcast_to(
+        numpy.asarray(advantage, dtype=numpy.int64) -
+        numpy.asarray(disadvantage, dtype=numpy.int64),
+        (count,)
+    )
+    if count and size.min() < 2:
+        raise ValueError('Exploding dice need at least two sides')
+
+    dice = quantity + numpy.abs(advantage)
+    width = int(dice.max()) if count else 0
+    columns = numpy.arange(width)
+    sides = size[:, None]
+
+    rolled = rng.integers(1, sides + 1, size=(count, width))
+    # Unused columns sort to the end that is thrown away
+    unused = columns >= dice[:, None]
+    lowest = advantage < 0
+    filler = numpy.broadcast_to(numpy.where(lowest[:, None], sides + 1, 0), rolled.shape)
+    rolled[unused] = filler[unused]
+    rolled.sort(axis=1)
+    kept = numpy.where(
+        lowest[:, None],
+        columns < quantity[:, None],
+        columns >= width - quantity[:, None]
+    )
+    total = (rolled * kept).sum(axis=1)
+    pending = ((rolled == sides) & kept).sum(axis=1)
+
+    while pending.any():
+        rows = numpy.nonzero(pending)[0]
+        sides = size[rows, None]
+        width = int(pending.max())
+        rolled = rng.integers(1, sides + 1, size=(len(rows), width))
+        valid = numpy.arange(width) < pending[rows, None]
+        total[rows] += (rolled * valid).sum(axis=1)
+        pending[rows] = ((rolled == sides) & valid).sum(axis=1)
+
+    return total
+
+
+def rolls(count, quantity, size, advantage=0, disadvantage=0, rng=None):
+    rng = generator(rng)
+    return explode_rolls(count, 1, 20, rng=rng) + explode_rolls(
+        count,
+        quantity,
+        size,
+        advantage=advantage,
+        disadvantage=disadvantage,
+        rng=rng
+    )
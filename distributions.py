@@ -0,0 +1,143 @@
+'''
+Exact outcome distributions for utils.explode_roll and utils.roll.
+
+A PMF is a tuple where pmf[n] is the probability of a total of n. Exploding
+dice have an unbounded tail, so it is cut off once the remaining terms are
+below TAIL; the total mass of a PMF is therefore 1 - O(TAIL). Results are
+memoised per parameter tuple, so repeated queries are dictionary lookups.
+'''
+import functools
+import math
+
+
+TAIL = 1e-12
+# TargetAction.damage / heal subtract this and turn 0-2 into MINIMUM
+THRESHOLD = 10
+MINIMUM = 3
+
+
+def convolve(a, b):
+    result = [0.0] * (len(a) + len(b) - 1)
+    for i, p in enumerate(a):
+        if p:
+            for j, q in enumerate(b):
+                result[i + j] += p * q
+    return trim(result)
+
+
+def trim(pmf):
+    pmf = list(pmf)
+    while len(pmf) > 1 and pmf[-1] < TAIL:
+        pmf.pop()
+    return tuple(pmf)
+
+
+@functools.lru_cache(maxsize=None)
+def exploding_die(size):
+    '''
+    One die that rolls again and adds whenever it shows its maximum.
+    '''
+    pmf = [0.0]
+    chance = 1 / size
+    while chance >= TAIL:
+        pmf += [chance] * (size - 1) + [0.0]
+        chance /= size
+    return trim(pmf)
+
+
+@functools.lru_cache(maxsize=None)
+def exploding_dice(count, size):
+    if count == 0:
+        return (1.0,)
+    return convolve(exploding_dice(count - 1, size), exploding_die(size))
+
+
+@functools.lru_cache(maxsize=None)
+def kept_dice(quantity, size, advantage):
+    '''
+    Joint distribution of (sum of kept dice, number of kept maximum rolls)
+    when quantity + |advantage| dice are rolled and the highest (advantage
+    >= 0) or lowest (advantage < 0) quantity of them are kept.
+    '''
+    dice = quantity + abs(advantage)
+    # Assign dice to values in the order they are kept
+    values = range(size, 0, -1) if advantage >= 0 else range(1, size + 1)
+    chance = 1 / size
+    states = {(0, 0, 0): 1.0}
+    for v in values:
+        last = v == values[-1]
+        next_states = {}
+        for (assigned, total, maximums), p in states.items():
+            remaining = dice - assigned
+            counts = [remaining] if last else range(remaining + 1)
+            for c in counts:
+                kept = max(0, min(c, quantity - assigned))
+                weight = p * math.comb(remaining, c) * chance ** c
+                key = (
+                    assigned + c,
+                    total + kept * v,
+                    maximums + (kept if v == size else 0)
+                )
+                next_states[key] = next_states.get(key, 0.0) + weight
+        states = next_states
+    result = {}
+    for (_, total, maximums), p in states.items():
+        result[total, maximums] = result.get((total, maximums), 0.0) + p
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def explode_pmf(quantity, size, advantage=0, disadvantage=0):
+    if size < 2:
+        raise ValueError('Exploding dice need at least two sides')
+    pmf = []
+    for (total, maximums), p in kept_dice(quantity, size, advantage - disadvantage).items():
+        tail = exploding_dice(maximums, size)
+        if len(pmf) < total + len(tail):
+            pmf += [0.0] * (total + len(tail) - len(pmf))
+        for n, q in enumerate(tail):
+            pmf[total + n] += p * q
+    return trim(pmf)
+
+
+@functools.lru_cache(maxsize=None)
+def roll_pmf(quantity, size, advantage=0, disadvantage=0):
+    return convolve(explode_pmf(1, 20), explode_pmf(quantity, size, advantage, disadvantage))
+
+
+def amount_pmf(pmf):
+    '''
+    Apply the damage / heal rules to a roll: subtract THRESHOLD, a miss is
+    0 and anything from 0 to MINIMUM - 1 becomes MINIMUM.
+    '''
+    result = [0.0] * max(MINIMUM + 1, len(pmf) - THRESHOLD)
+    for roll, p in enumerate(pmf):
+        amount = roll - THRESHOLD
+        if amount < 0:
+            amount = 0
+        elif amount < MINIMUM:
+            amount = MINIMUM
+        result[amount] += p
+    return tuple(result)
+
+
+@functools.lru_cache(maxsize=None)
+def damage_pmf(quantity, size, advantage=0, disadvantage=0):
+    return amount_pmf(roll_pmf(quantity, size, advantage, disadvantage))
+
+
+def expected(pmf):
+    return sum(n * p for n, p in enumerate(pmf))
+
+
+@functools.lru_cache(maxsize=None)
+def expected_damage(quantity, size, advantage=0, disadvantage=0):
+    return expected(damage_pmf(quantity, size, advantage, disadvantage))
+
+
+@functools.lru_cache(maxsize=None)
+def hit_chance(quantity, size, advantage=0, disadvantage=0):
+    '''
+    Chance that a roll does not miss (or fizzle), i.e. reaches THRESHOLD.
+    '''
+    return sum(roll_pmf(quantity, size, advantage, disadvantage)[THRESHOLD:])
@@ -0,0 +1,79 @@
+'''
+Idle throttling.
+
+The platform calls the EventHandler at a fixed frame rate. While the game
+sits still (no input, no change of state, no animation), the Governor
+lets fewer and fewer of those frames do any work, in tiers of lower rates
+the longer it stays idle. Input or any change goes straight back to the
+full rate.
+'''
+import collections
+import time
+
+
+# (seconds idle, frames per second that do work), None being every frame
+TIERS = [
+    (0, None),
+    (2, 10),
+    (10, 2),
+]
+
+
+class Governor:
+
+    def __init__(self, tiers=TIERS, clock=time.perf_counter):
+        self.tiers = tiers
+        self.clock = clock
+        self.idle_since = None
+        self.last_frame = None
+        self.last_work = None
+        self.tier = 0
+        self.seconds = collections.Counter()
+
+    def wake(self):
+        self.idle_since = None
+        self.tier = 0
+
+    def idle(self):
+        '''
+        Call after a frame in which nothing changed.
+        '''
+        if self.idle_since is None:
+            self.idle_since = self.clock()
+
+    def due(self):
+        '''
+        Whether this frame should update and draw.
+        '''
+        now = self.clock()
+        if self.last_frame is not None:
+            self.seconds[self.tier] += now - self.last_frame
+        self.last_frame = now
+
+        idle = 0 if self.idle_since is None else now - self.idle_since
+        self.tier = max(
+            i for i, (after, _) in enumerate(self.tiers) if idle >= after
+        )
+        rate = self.tiers[self.tier][1]
+        # A little early is fine, or a rate that divides the frame rate
+        # would keep missing by rounding
+        if rate is None or self.last_work is None or now - self.last_work >= 0.9 / rate:
+            self.last_work = now
+            return True
+        return False
+
+    @property
+    def rate(self):
+        '''
+        Work rate of the current tier, None for every frame.
+        '''
+        return self.tiers[self.tier][1]
+
+    def report(self):
+        '''
+        [(tier name, seconds spent in it)]
+        '''
+        return [
+            ('full rate' if rate is None else f'{rate:g} fps', self.seconds[i])
+            for i, (_, rate) in enumerate(self.tiers)
+        ]
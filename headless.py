@@ -0,0 +1,194 @@
+import collections
+import os
+import time
+
+import utils
+
+
+def simulate_load(filename, load_rate):
+    # Pretend decoding takes time proportional to the file size
+    if load_rate:
+        time.sleep(os.path.getsize(filename) / load_rate)
+
+
+class Texture:
+
+    def __init__(self, w, h, filename=None):
+        self.w = w
+        self.h = h
+        self.filename = filename
+
+    @property
+    def size(self):
+        return self.w, self.h
+
+
+class Pixels:
+    '''
+    A decoded image, ready to upload.
+    '''
+
+    def __init__(self, w, h, filename):
+        self.w = w
+        self.h = h
+        self.filename = filename
+
+
+class Renderer:
+
+    def __init__(self, window, load_rate=None):
+        self.window = window
+        self.load_rate = load_rate
+        self.target = None
+        self.draw_color = 0, 0, 0, 255
+        self.calls = collections.Counter()
+        self.bound = None
+        # Seconds present() blocks, as a GPU or vsync wait would
+        self.present_time = 0
+
+    def create_texture(self, w, h):
+        self.calls['create_texture'] += 1
+        return Texture(w, h)
+
+    def create_texture_from_image(self, filename):
+        self.calls['create_texture_from_image'] += 1
+        simulate_load(filename, self.load_rate)
+        return Texture(*utils.png_size(filename), filename=filename)
+
+    def decode_image(self, filename):
+        # Safe off the render thread, as decoding touches no GPU state
+        simulate_load(filename, self.load_rate)
+        return Pixels(*utils.png_size(filename), filename)
+
+    def create_texture_from_pixels(self, pixels):
+        self.calls['create_texture_from_pixels'] += 1
+        return Texture(pixels.w, pixels.h, filename=pixels.filename)
+
+    def clear(self):
+        self.calls['clear'] += 1
+
+    def bind(self, texture):
+        if texture is not self.bound:
+            self.calls['texture_switch'] += 1
+            self.bound = texture
+
+    def copy(self, texture, sx, sy, sw, sh, dx, dy, dw, dh):
+        self.calls['copy'] += 1
+        self.bind(texture)
+
+    def copy_many(self, texture, copies):
+        self.calls['copy_many'] += 1
+        self.bind(texture)
+        self.calls['copy_many_sprites'] += len(copies)
+
+    def present(self):
+        self.calls['present'] += 1
+        if self.present_time:
+            time.sleep(self.present_time)
+
+
+class Window:
+
+    def __init__(self, title, w, h, load_rate=None):
+        self.title = title
+        self.size = w, h
+        self.load_rate = load_rate
+        self.renderer = None
+
+    def create_renderer(self):
+        self.renderer = Renderer(self, self.load_rate)
+        return self.renderer
+
+
+class Music:
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class Effect:
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class Stream:
+
+    def __init__(self, frequency, channels, callback):
+        self.frequency = frequency
+        self.channels = channels
+        self.callback = callback
+        self.volume = 0
+        self.closed = False
+
+    def pull(self, n):
+        return self.callback(n)
+
+    def close(self):
+        self.closed = True
+
+
+class Audio:
+
+    def __init__(self, load_rate=None):
+        self.load_rate = load_rate
+        self.calls = collections.Counter()
+        self.music = None
+        self.music_volume = 0
+
+    def load_music(self, filename):
+        self.calls['load_music'] += 1
+        simulate_load(filename, self.load_rate)
+        return Music(filename)
+
+    def load_effect(self, filename):
+        self.calls['load_effect'] += 1
+        simulate_load(filename, self.load_rate)
+        return Effect(filename)
+
+    def play_music(self, music):
+        self.calls['play_music'] += 1
+        self.music = music
+
+    def play_effect(self, effect, volume):
+        self.calls['play_effect'] += 1
+
+    def open_stream(self, frequency, channels, callback):
+        self.calls['open_stream'] += 1
+        return Stream(frequency, channels, callback)
+
+    def set_music_volume(self, volume):
+        self.calls['set_music_volume'] += 1
+        self.music_volume = volume
+
+
+class Pyxelen:
+    '''
+    Stand-in for pyxelen.Pyxelen that records calls instead of drawing or
+    playing anything, so the game can be driven without a display. Set
+    load_rate (bytes per second) to make asset loads take time like real
+    decoding does.
+    '''
+
+    def __init__(self, load_rate=None):
+        self.load_rate = load_rate
+        self.audio = Audio(load_rate)
+        self.window = None
+
+    def open_window(self, title, w, h):
+        self.window = Window(title, w, h, self.load_rate)
+        return self.window
+
+    def key_down(self, handler, key, modifiers=0, repeat=False):
+        handler.on_key_down(self.window, key, modifiers, repeat)
+
+    def run(self, handler, fps, frames=None):
+        frame_time = 1 / fps if fps else 0
+        frame = 0
+        while frames is None or frame < frames:
+            start = time.perf_counter()
+            handler.on_update_and_render()
+            frame += 1
+            remaining = frame_time - (time.perf_counter() - start)
+            if remaining > 0:
+                time.sleep(remaining)
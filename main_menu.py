@@ -6,10 +6,6 @@ from sounds import *
 from utils import *
 
 
-def set_scene(state, **kwargs):
-    return state.set(scene=state.scene.set(**kwargs))
-
-
 def selection(state):
     return state.scene.selection
 
@@ -26,7 +22,7 @@ def select_prev(state):
 
 def select(state):
     if selection(state) == model.MainMenuSelection.PLAY:
-        return state.set(scene=model.ACT1).play_effect(FX_SELECT)
+        return state.enter_scene(model.ACT1).play_effect(FX_SELECT)
     elif selection(state) == model.MainMenuSelection.OPTIONS:
         return state.set(
             scene=model.Settings(
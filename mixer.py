@@ -0,0 +1,64 @@
+import collections
+import time
+
+from sounds import *
+
+
+# Most voices of a single effect started in one frame
+VOICE_LIMIT = 1
+VOICE_LIMITS = {}
+# Most effect voices started in one frame, highest priority first
+MAX_VOICES = 4
+PRIORITIES = {
+    FX_SELECT: 2,
+    FX_BLIP: 1,
+}
+
+
+class Mixer:
+    '''
+    Sits between the game state and the audio backend. Music volume is only
+    sent when it changes, and the effects queued during a frame are merged
+    so each one plays at most its voice limit, highest priority first.
+
+    `requested` counts the calls a naive frame would have made (one volume
+    update plus one call per queued effect), `sent` the calls made.
+    '''
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.music_volume = None
+        self.requested = collections.Counter()
+        self.sent = collections.Counter()
+        self.started = time.perf_counter()
+
+    def set_music_volume(self, volume):
+        self.requested['set_music_volume'] += 1
+        if volume == self.music_volume:
+            return False
+        self.audio.set_music_volume(volume)
+        self.sent['set_music_volume'] += 1
+        self.music_volume = volume
+        return True
+
+    def play_effects(self, effects, play):
+        self.requested['play_effect'] += len(effects)
+        counts = collections.Counter(effects)
+        voices = []
+        for effect, count in counts.items():
+            voices += [effect] * min(count, VOICE_LIMITS.get(effect, VOICE_LIMIT))
+        voices.sort(key=lambda effect: PRIORITIES.get(effect, 0), reverse=True)
+        for effect in voices[:MAX_VOICES]:
+            play(effect)
+            self.sent['play_effect'] += 1
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        requested = sum(self.requested.values())
+        sent = sum(self.sent.values())
+        return {
+            'requested': requested,
+            'sent': sent,
+            'requested_per_second': requested / elapsed,
+            'sent_per_second': sent / elapsed,
+        }
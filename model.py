@@ -1,12 +1,42 @@
 import random
 import enum
+import collections
 import pyrsistent
 
 import utils
 from sounds import *
 
 
-class Action(pyrsistent.PClass):
+# Records created so far, by class name. For spotting allocations in
+# steady-state frames, see allocation_count().
+ALLOCATIONS = collections.Counter()
+
+
+def allocation_count():
+    return sum(ALLOCATIONS.values())
+
+
+class Record(pyrsistent.PClass):
+    '''
+    PClass that counts its allocations and can skip no-op updates.
+    '''
+
+    def __new__(cls, **kwargs):
+        ALLOCATIONS[cls.__name__] += 1
+        return super().__new__(cls, **kwargs)
+
+    def update(self, **kwargs):
+        '''
+        Like set(), but returns self when every value equals the current one.
+        '''
+        for name, value in kwargs.items():
+            current = getattr(self, name)
+            if current is not value and current != value:
+                return self.set(**kwargs)
+        return self
+
+
+class Action(Record):
     effect_description = pyrsistent.field(type=str, initial='', mandatory=True)
 
     @property
@@ -18,7 +48,6 @@ class Action(pyrsistent.PClass):
 
 
 class EnemyAction(Action):
-    countdown = pyrsistent.field(type=int, mandatory=True, initial=10)
 
     @property
     def name(self):
@@ -26,7 +55,6 @@ class EnemyAction(Action):
 
 
 class PendingAction(Action):
-    countdown = pyrsistent.field(type=int, mandatory=True, initial=30)
     action = pyrsistent.field(type=Action, mandatory=True)
     result = pyrsistent.field(mandatory=True)
 
@@ -49,23 +77,21 @@ class TargetAction(Action):
             return chars[len(chars) - 1]
 
     def set_character(self, state, character):
-        target = self.character(state)
-        return self.set_characters(
-            state,
-            pyrsistent.pvector(
-                character if c is target else c
-                for c in self.characters(state)
-            )
-        )
+        transaction = state.transaction()
+        self.replace_character(transaction, character)
+        return transaction.commit()
+
+    def replace_character(self, transaction, character):
+        target = self.character(transaction.state)
+        characters = transaction.side(self.SIDE)
+        for i, c in enumerate(self.characters(transaction.state)):
+            if c is target:
+                characters[i] = character
 
     def set_description(self, state, description):
-        return state.set(
-            scene=state.scene.set(
-                action=state.scene.action.set(
-                    effect_description=description
-                )
-            )
-        )
+        transaction = state.transaction()
+        transaction.describe(description)
+        return transaction.commit()
 
     def damage(self, state, amount):
         amount -= 10
@@ -77,7 +103,10 @@ class TargetAction(Action):
             desc = f'Did {amount} Damage'
         else:
             desc = f'Did {amount} Damage'
-        return self.set_description(self.set_character(state, self.character(state).damage(amount)), desc)
+        transaction = state.transaction()
+        self.replace_character(transaction, self.character(state).damage(amount))
+        transaction.describe(desc)
+        return transaction.commit()
 
     def heal(self, state, amount):
         amount -= 10
@@ -89,29 +118,24 @@ class TargetAction(Action):
             desc = f'Did {amount} Healing'
         else:
             desc = f'Did {amount} Healing'
-        return self.set_description(self.set_character(state, self.character(state).heal(amount)), desc)
+        transaction = state.transaction()
+        self.replace_character(transaction, self.character(state).heal(amount))
+        transaction.describe(desc)
+        return transaction.commit()
 
 class TargetEnemyAction(TargetAction):
+    SIDE = 'enemies'
 
     def characters(self, state):
         return state.scene.enemies
 
-    def set_characters(self, state, characters):
-        return state.set(
-            scene=state.scene.set(
-                enemies=characters
-            )
-        )
-
 
 class TargetFriendlyAction(TargetAction):
+    SIDE = 'characters'
 
     def characters(self, state):
         return state.characters
 
-    def set_characters(self, state, characters):
-        return state.set(characters=characters)
-
 
 class KickAction(TargetEnemyAction):
 
@@ -154,6 +178,16 @@ class SlashAction(TargetEnemyAction):
 
 
 SUMMON_INDEX = 100
+# Entity IDs tell combatants apart even when they are otherwise equal, e.g.
+# two summoned skeletons. 0 means not yet in a battle.
+ENTITY_ID = 0
+
+
+def new_entity():
+    global ENTITY_ID
+    ENTITY_ID += 1
+    return ENTITY_ID
+
 
 class SummonAction(Action):
 
@@ -168,14 +202,12 @@ class SummonAction(Action):
     def apply(self, state):
         global SUMMON_INDEX
         SUMMON_INDEX += 1
-        return state.set(
-            scene=state.scene.set(
-                action=state.scene.action.set(
-                    effect_description=f'Summoned a Skeleton Minion'
-                ),
-                enemies=state.scene.enemies.append(SKELETON_1.set(index=SUMMON_INDEX))
-            )
+        transaction = state.transaction()
+        transaction.describe(f'Summoned a Skeleton Minion')
+        transaction.side('enemies').append(
+            SKELETON_1.set(index=SUMMON_INDEX, entity=new_entity())
         )
+        return transaction.commit()
 
 
 class FireballAction(Action):
@@ -190,9 +222,10 @@ class FireballAction(Action):
         return 'Fireball'
 
     def apply(self, state):
-        enemies = []
+        transaction = state.transaction()
+        enemies = transaction.side('enemies')
         total_damage = 0
-        for enemy in state.scene.enemies:
+        for i, enemy in enumerate(state.scene.enemies):
             raw_damage = utils.roll(1, 10, disadvantage=1) - 10
             if raw_damage < 0:
                 damage = 0
@@ -200,19 +233,10 @@ class FireballAction(Action):
                 damage = 3
             else:
                 damage = raw_damage
-            enemy = enemy.set(health=enemy.health - damage)
+            enemies[i] = enemy.damage(damage)
             total_damage += damage
-            if enemy.health < 0:
-                enemy = enemy.set(health=0)
-            enemies.append(enemy)
-        return state.set(
-            scene=state.scene.set(
-                action=state.scene.action.set(
-                    effect_description=f'Did {total_damage} Damage'
-                ),
-                enemies=pyrsistent.pvector(enemies)
-            )
-        )
+        transaction.describe(f'Did {total_damage} Damage')
+        return transaction.commit()
 
 
 class FireboltAction(TargetEnemyAction):
@@ -263,16 +287,12 @@ class CongealAction(TargetEnemyAction):
         return 'Congeal'
 
     def apply(self, state):
-        return state.set(
-            scene=state.scene.set(
-                action=state.scene.action.set(
-                    effect_description=f'Congealed with other Oozes to Solidify'
-                ),
-                enemies=pyrsistent.pvector(
-                    e.set(health=e.health + 10) for e in state.scene.enemies
-                )
-            )
-        )
+        transaction = state.transaction()
+        enemies = transaction.side('enemies')
+        for i, e in enumerate(state.scene.enemies):
+            enemies[i] = e.set(health=e.health + 10)
+        transaction.describe(f'Congealed with other Oozes to Solidify')
+        return transaction.commit()
 
 
 class BiteAction(TargetFriendlyAction):
@@ -338,9 +358,10 @@ class StabilizeAction(TargetFriendlyAction):
             return state
 
 
-class Character(pyrsistent.PClass):
+class Character(Record):
     name = pyrsistent.field(type=str, mandatory=True)
     index = pyrsistent.field(type=int, mandatory=True, initial=1)
+    entity = pyrsistent.field(type=int, mandatory=True, initial=0)
     health = pyrsistent.field(type=int, mandatory=True)
     max_health = pyrsistent.field(type=int, mandatory=True)
     size = pyrsistent.field(type=str, mandatory=True)
@@ -348,15 +369,21 @@ class Character(pyrsistent.PClass):
 
     def damage(self, amount):
         if self.health - amount < 0:
-            return self.set(health=0)
+            return self.update(health=0)
         else:
-            return self.set(health=self.health - amount)
+            return self.update(health=self.health - amount)
 
     def heal(self, amount):
         if self.health + amount > self.max_health:
-            return self.set(health=self.max_health)
+            return self.update(health=self.max_health)
+        else:
+            return self.update(health=self.health + amount)
+
+    def enter_battle(self):
+        if self.entity:
+            return self
         else:
-            return self.set(health=self.health + amount)
+            return self.set(entity=new_entity())
 
     @property
     def is_dead(self):
@@ -376,7 +403,7 @@ class Character(pyrsistent.PClass):
 
 
 
-class DialogItem(pyrsistent.PClass):
+class DialogItem(Record):
     speaker = pyrsistent.field(type=str, mandatory=True)
     lines = pyrsistent.pvector_field(str)
     image = pyrsistent.field(type=str, mandatory=True, initial='')
@@ -416,7 +443,7 @@ class SettingsSelection(Selection):
     EFFECTS_VOLUME = 'Effects Volume'
 
 
-class Scene(pyrsistent.PClass):
+class Scene(Record):
     pass
 
 
@@ -452,7 +479,7 @@ class GameOver(Scene):
     screen = Screen.GAME_OVER
 
 
-class Model(pyrsistent.PClass):
+class Model(Record):
     scene = pyrsistent.field(type=Scene, mandatory=True)
     effects = pyrsistent.pvector_field(str)
     music = pyrsistent.field(type=str, mandatory=True)
@@ -461,13 +488,89 @@ class Model(pyrsistent.PClass):
     characters = pyrsistent.pvector_field(Character)
 
     def clear_effects(self):
+        if not self.effects:
+            return self
         return self.set(effects=pyrsistent.pvector([]))
 
     def play_effect(self, effect):
         return self.set(effects=self.effects.append(effect))
 
     def set_music(self, music):
-        return self.set(music=music)
+        return self.update(music=music)
+
+    def transaction(self):
+        return Transaction(self)
+
+    def enter_scene(self, scene, **changes):
+        '''
+        Moves to scene. The story's scene changes go through here, so a
+        Battle has its entity IDs before it is first drawn or played.
+        '''
+        return self.set(scene=scene, **changes).enter_battle()
+
+    def enter_battle(self):
+        '''
+        Gives every combatant in a Battle scene that does not have an entity
+        ID yet a new one.
+        '''
+        scene = self.scene
+        if not isinstance(scene, Battle):
+            return self
+        if all(c.entity for c in self.characters) and all(c.entity for c in scene.enemies):
+            return self
+        return self.set(
+            characters=[c.enter_battle() for c in self.characters],
+            scene=scene.set(enemies=[c.enter_battle() for c in scene.enemies])
+        )
+
+
+
+class Transaction:
+    '''
+    Collects changes to a Model, its Battle scene and the scene's action and
+    builds each changed level once in commit(), instead of one nested set()
+    chain per change. The character lists are pvector evolvers, so only the
+    characters that are replaced are type checked again.
+    '''
+
+    def __init__(self, state):
+        self.state = state
+        self.description = None
+        self.sides = {}
+
+    def side(self, name):
+        '''
+        Evolver for state.characters ('characters') or the scene's enemies
+        ('enemies'), to change in place.
+        '''
+        if name not in self.sides:
+            if name == 'characters':
+                self.sides[name] = self.state.characters.evolver()
+            else:
+                self.sides[name] = self.state.scene.enemies.evolver()
+        return self.sides[name]
+
+    def describe(self, description):
+        self.description = description
+
+    def commit(self):
+        state = self.state
+        scene_changes = {}
+        if self.description is not None:
+            scene_changes['action'] = state.scene.action.update(
+                effect_description=self.description
+            )
+        if 'enemies' in self.sides:
+            scene_changes['enemies'] = self.sides['enemies'].persistent()
+        changes = {}
+        if 'characters' in self.sides:
+            changes['characters'] = self.sides['characters'].persistent()
+        if scene_changes:
+            changes['scene'] = state.scene.set(**scene_changes)
+        if changes:
+            return state.set(**changes)
+        else:
+            return state
 
 
 CHARACTERS = pyrsistent.pvector([
@@ -685,7 +788,7 @@ ACT6 = CutScene(
 
 SKELETON_BATTLE = Battle(
     initiative = 3,
-    action=EnemyAction(countdown=30),
+    action=EnemyAction(),
     background='images/cave.png',
     next_scene=ACT6,
     enemies=pyrsistent.pvector([
@@ -945,7 +1048,7 @@ ACT2 = CutScene(
 OOZE_BATTLE = Battle(
     initiative=3,
     background='images/sewer.png',
-    action=EnemyAction(countdown=30),
+    action=EnemyAction(),
     next_scene=ACT2,
     enemies=pyrsistent.pvector([
         OOZE_1, OOZE_2
@@ -1,6 +1,8 @@
 import model
 import pyxelen
 
+from selector import selector
+
 from view import *
 from sounds import *
 from utils import *
@@ -104,27 +106,25 @@ def on_update(state):
     return state
 
 
-def view(renderer, state):
-    renderer.draw_sprite(BAR, FULLSCREEN)
-    renderer.draw_text(
-        MAIN_FONT,
-         'Options..................................ESC to Save',
-         20, 20, False
-    )
-
-    renderer.draw_text(
-        MAIN_FONT,
-        '    Music Volume: ' + str(state.music_volume),
-        20, 40, False
-    )
+@selector
+def lines(state):
+    return [
+        'Options..................................ESC to Save',
+        '    Music Volume: ' + str(music_volume(state)),
+        '    Effects Volume: ' + str(effects_volume(state)),
+    ]
 
-    renderer.draw_text(
-        MAIN_FONT,
-        '    Effects Volume: ' + str(state.effects_volume),
-        20, 60, False
-    )
 
-    if state.scene.selection == model.SettingsSelection.MUSIC_VOLUME:
-        renderer.draw_sprite(RIGHT_ARROW, Box(16, 36, 16, 16))
+@selector
+def arrow(state):
+    if selection(state) == model.SettingsSelection.MUSIC_VOLUME:
+        return Box(16, 36, 16, 16)
     else:
-        renderer.draw_sprite(RIGHT_ARROW, Box(16, 56, 16, 16))
+        return Box(16, 56, 16, 16)
+
+
+def view(renderer, state):
+    renderer.draw_sprite(BAR, FULLSCREEN)
+    for i, line in enumerate(lines(state)):
+        renderer.draw_text(MAIN_FONT, line, 20, 20 + i * 20, False)
+    renderer.draw_sprite(RIGHT_ARROW, arrow(state))
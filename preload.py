@@ -0,0 +1,196 @@
+import queue
+import threading
+import traceback
+
+import model
+import resources
+import view
+from sounds import *
+
+
+DEPTH = 2
+# Textures have to be created on the render thread, so spread them out
+IMAGES_PER_FRAME = 1
+
+
+def scene_assets(scene):
+    if isinstance(scene, model.CutScene):
+        yield 'image', scene.background
+        for item in scene.dialog:
+            if item.image != '':
+                yield 'image', item.image
+        yield 'music', scene.music
+    elif isinstance(scene, model.Battle):
+        yield 'image', scene.background
+        yield 'music', MUSIC_BATTLE
+        yield 'image', 'images/game-over.png'
+        yield 'music', MUSIC_GAME_OVER
+    elif isinstance(scene, model.MainMenu):
+        yield 'image', view.MENU_BACKGROUND.filename
+        yield 'music', MUSIC_MENU
+
+
+def following(scene):
+    # The main menu has no next_scene, but Play is where it usually goes
+    if isinstance(scene, model.MainMenu):
+        return model.ACT1
+    return getattr(scene, 'next_scene', None)
+
+
+def upcoming(scene, depth):
+    for _ in range(depth):
+        scene = following(scene)
+        if scene is None:
+            return
+        yield scene
+
+
+class Preloader:
+    '''
+    Loads the assets of the next few scenes on a worker thread.
+
+    Music is loaded on the worker. Textures have to be created on the
+    render thread, so images are decoded to pixels on the worker when the
+    renderer can do that (decode_image), and pump() only uploads a few of
+    them per frame. Otherwise the worker only reads the file into the OS
+    cache and pump() decodes it too. take() hands a ready asset to the
+    render thread, and counts a hit if it was ready or a stall if the
+    caller has to load it itself.
+
+    Assets already in the ResourceManager are not loaded again. Handles
+    still unclaimed when the story moves past their scene are dropped, so
+    the only copies held outside the resource budgets are those of the
+    current and next few scenes.
+    '''
+
+    def __init__(self, loaders, resident=None, decode_image=None, depth=DEPTH):
+        '''
+        resident(kind, filename) tells whether an asset is already loaded.
+        decode_image(filename) returns pixels for pump() to upload, and must
+        be safe to call off the render thread.
+        '''
+        self.loaders = loaders
+        self.resident = resident or (lambda kind, filename: False)
+        self.decode_image = decode_image
+        self.depth = depth
+        self.requests = queue.Queue()
+        self.warm = queue.Queue()
+        self.lock = threading.Lock()
+        self.requested = set()
+        self.ready = {}
+        self.next_scene = None
+        self.hits = 0
+        self.stalls = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(
+            target=self.work, name='preloader', daemon=True
+        )
+        self.thread.start()
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            # Skip whatever is still queued once closed
+            if request is None or self.closed:
+                return
+            kind, filename = request
+            try:
+                if kind == 'image':
+                    if self.decode_image is not None:
+                        pixels = self.decode_image(filename)
+                    else:
+                        with open(filename, 'rb') as f:
+                            f.read()
+                        pixels = None
+                    self.warm.put((filename, pixels))
+                else:
+                    handle = self.loaders[kind](filename)
+                    with self.lock:
+                        self.ready[kind, filename] = handle
+            except Exception:
+                traceback.print_exc()
+
+    def prefetch(self, scene):
+        # Scene.set keeps the next_scene object, so this is cheap to call
+        # every frame and only walks the chain when the story moves on
+        next_scene = following(scene)
+        if next_scene is self.next_scene:
+            return
+        self.next_scene = next_scene
+        wanted = set(scene_assets(scene))
+        for upcoming_scene in upcoming(scene, self.depth):
+            for asset in scene_assets(upcoming_scene):
+                wanted.add(asset)
+                kind = asset[0]
+                if kind != 'image' and kind not in self.loaders:
+                    continue
+                if asset in self.requested or self.resident(*asset):
+                    continue
+                with self.lock:
+                    if asset in self.ready:
+                        continue
+                self.requested.add(asset)
+                self.requests.put(asset)
+        self.drop(wanted)
+
+    def drop(self, wanted):
+        '''
+        Forgets ready handles for assets not in wanted.
+        '''
+        with self.lock:
+            unwanted = [asset for asset in self.ready if asset not in wanted]
+            for asset in unwanted:
+                del self.ready[asset]
+        self.requested.difference_update(unwanted)
+        self.dropped += len(unwanted)
+
+    def pump(self, upload, limit=IMAGES_PER_FRAME):
+        '''
+        upload(filename, pixels) creates a texture, from pixels or from the
+        file if pixels is None.
+        '''
+        for _ in range(limit):
+            try:
+                filename, pixels = self.warm.get_nowait()
+            except queue.Empty:
+                return
+            if self.resident('image', filename):
+                # Loaded by the render thread while the file was read
+                self.requested.discard(('image', filename))
+                continue
+            texture = upload(filename, pixels)
+            with self.lock:
+                self.ready['image', filename] = texture
+
+    def take(self, kind, filename):
+        with self.lock:
+            handle = self.ready.pop((kind, filename), None)
+        # Allow it to be fetched again if it is evicted later
+        self.requested.discard((kind, filename))
+        if handle is None:
+            self.stalls += 1
+        else:
+            self.hits += 1
+        return handle
+
+    def close(self):
+        self.closed = True
+        self.requests.put(None)
+        self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            ready = dict(self.ready)
+        # Bytes held per kind, outside the ResourceManager budgets
+        held = dict.fromkeys(resources.BUDGETS, 0)
+        for (kind, filename), handle in ready.items():
+            held[kind] = held.get(kind, 0) + resources.estimate_size(kind, filename, handle)
+        return {
+            'hits': self.hits,
+            'stalls': self.stalls,
+            'dropped': self.dropped,
+            'requested': len(self.requested),
+            'ready': len(ready),
+            'held': held,
+        }
@@ -0,0 +1,203 @@
+'''
+Per-frame phase timings for the EventHandler.
+
+The handler calls lap(phase) as each part of the frame finishes, so every
+phase is charged the time since the previous lap. Frames go into a ring
+buffer of the last FRAMES frames, which can be drawn over the game or
+dumped to CSV. When profiling is off the handler makes none of these
+calls.
+
+Capture runs cProfile over a number of handler calls instead, for the
+function-level picture, and reports it by screen module.
+
+The overlay draws glyph by glyph rather than with draw_text, as its text
+changes on every redraw and would only churn the text run and layout caches.
+'''
+import collections
+import cProfile
+import csv
+import os
+import pstats
+import time
+
+import view
+
+
+FRAMES = 300
+PHASES = ['update', 'view', 'overlay', 'present', 'audio', 'other']
+COUNTERS = ['batches', 'copies', 'cache hits', 'cache misses']
+COLUMNS = ['frame', 'time'] + PHASES + ['total'] + COUNTERS
+
+# Overlay layout
+GRAPH_FRAMES = 60
+GRAPH_ROWS = 4
+# Frame time of the top graph row, the frame budget at 30 fps
+GRAPH_MS = 1000 / 30
+BAR_MS = 1
+# Overlay redraws per second
+OVERLAY_RATE = 4
+# Functions listed per group in a capture report
+CAPTURE_TOP = 10
+
+
+class FrameProfiler:
+
+    def __init__(self, frames=FRAMES, clock=time.perf_counter):
+        self.clock = clock
+        self.frames = collections.deque(maxlen=frames)
+        self.count = 0
+        self.row = None
+        self.last = None
+        self.hits = None
+        self.misses = None
+        # Overlay texture and when it was drawn
+        self.overlay = None
+        self.overlay_at = None
+
+    def begin_frame(self):
+        self.last = self.clock()
+        self.row = dict.fromkeys(PHASES, 0.0)
+
+    def lap(self, phase):
+        if self.row is None:
+            # Drawn outside a profiled frame
+            return
+        now = self.clock()
+        self.row[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, batches, copies, cache_stats):
+        self.lap('other')
+        hits = sum(stats['hits'] for stats in cache_stats.values())
+        misses = sum(stats['misses'] for stats in cache_stats.values())
+        row = self.row
+        row['frame'] = self.count
+        row['time'] = self.last
+        row['total'] = sum(row[phase] for phase in PHASES)
+        row['batches'] = batches
+        row['copies'] = copies
+        # Counts since the previous profiled frame
+        row['cache hits'] = hits - self.hits if self.hits is not None else 0
+        row['cache misses'] = misses - self.misses if self.misses is not None else 0
+        self.hits = hits
+        self.misses = misses
+        self.frames.append(row)
+        self.count += 1
+        self.row = None
+
+    def dump(self, filename):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writeheader()
+            for row in self.frames:
+                writer.writerow({
+                    name: value * 1000 if name in PHASES or name == 'total' else value
+                    for name, value in row.items()
+                })
+
+    def averages(self, frames=GRAPH_FRAMES):
+        rows = list(self.frames)[-frames:]
+        if not rows:
+            return {}
+        return {
+            name: sum(row[name] for row in rows) / len(rows)
+            for name in PHASES + ['total'] + COUNTERS
+        }
+
+    def overlay_due(self):
+        now = self.clock()
+        if self.overlay is None or now - self.overlay_at >= 1 / OVERLAY_RATE:
+            self.overlay_at = now
+            return True
+        return False
+
+    def draw(self, renderer, x=8, y=8):
+        '''
+        Average milliseconds per phase with a bar each, then a graph of
+        total frame time, drawn in view.MAIN_FONT.
+        '''
+        averages = self.averages()
+        if not averages:
+            return
+        for i, name in enumerate(PHASES + ['total']):
+            ms = averages[name] * 1000
+            bar = '-' * min(40, round(ms / BAR_MS))
+            draw_line(renderer, f'{name:<8}{ms:6.2f}ms {bar}', x, y + i * 10)
+        y += (len(PHASES) + 1) * 10
+        draw_line(
+            renderer,
+            f'batches {averages["batches"]:.0f} copies {averages["copies"]:.0f}'
+            f' cache {averages["cache hits"]:.0f} hit {averages["cache misses"]:.0f} miss',
+            x, y
+        )
+        y += 12
+        totals = [row['total'] * 1000 for row in list(self.frames)[-GRAPH_FRAMES:]]
+        for row in range(GRAPH_ROWS):
+            level = GRAPH_MS * (GRAPH_ROWS - row) / GRAPH_ROWS
+            line = ''.join(':' if ms >= level else '.' for ms in totals)
+            draw_line(renderer, line, x, y + row * 8)
+
+
+def draw_line(renderer, text, x, y, font=view.MAIN_FONT):
+    for c in text:
+        advance, offset_y = font.offsets.get(c, (int(font.size_x / 2), 0))
+        if c in font.glyphs:
+            renderer.draw_sprite(
+                font.glyphs[c],
+                view.Box(x, y + offset_y, font.size_x, font.size_y)
+            )
+        x += advance
+
+
+class Capture:
+    '''
+    cProfile over the next calls handler calls. Only the calls themselves
+    are profiled, not the platform's waiting in between. cProfile only
+    sees the thread it runs on, so with the threaded simulation this is
+    the drawing side alone.
+    '''
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.made = 0
+        self.profile = cProfile.Profile()
+
+    def call(self, function, *args):
+        '''
+        Profiles function(*args) and returns whether the capture is complete.
+        '''
+        self.profile.enable()
+        try:
+            function(*args)
+        finally:
+            self.profile.disable()
+            self.made += 1
+        return self.made >= self.calls
+
+    def dump(self, filename):
+        self.profile.dump_stats(filename)
+
+    def report(self, modules, top=CAPTURE_TOP):
+        '''
+        Prints the top functions by cumulative time, overall and then for
+        each of modules (module names) that showed up.
+        '''
+        stats = pstats.Stats(self.profile).stats
+        groups = collections.defaultdict(list)
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.items():
+            function = calls, own, cumulative, f'{os.path.basename(filename)}:{line}({name})'
+            groups['all'].append(function)
+            module = os.path.splitext(os.path.basename(filename))[0]
+            if module in modules:
+                groups[module].append(function)
+        print(f'{self.made} calls')
+        for group in ['all'] + sorted(modules):
+            functions = groups.get(group)
+            if not functions:
+                continue
+            functions.sort(key=lambda function: function[2], reverse=True)
+            own = sum(function[1] for function in functions)
+            print(f'\n{group} (own time {own * 1000:.1f}ms)')
+            print(f'{"calls":>10}{"own ms":>10}{"cum ms":>10}  function')
+            for calls, own, cumulative, name in functions[:top]:
+                print(f'{calls:>10}{own * 1000:>10.2f}{cumulative * 1000:>10.2f}  {name}')
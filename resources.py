@@ -0,0 +1,65 @@
+import os
+
+import cache
+import utils
+
+
+MEGABYTE = 1024 * 1024
+BUDGETS = {
+    'image': 32 * MEGABYTE,
+    'music': 8 * MEGABYTE,
+    'effect': 2 * MEGABYTE,
+}
+
+
+def estimate_size(kind, filename, handle):
+    '''
+    Approximate resident bytes. Textures are 4 bytes per pixel. Music and
+    effects are counted at their file size, which is what the mixer keeps
+    around for streamed OGG and close to it for the small WAV effects.
+    '''
+    if kind == 'image':
+        size = getattr(handle, 'size', None)
+        if size is None:
+            size = utils.png_size(filename)
+        return size[0] * size[1] * 4
+    else:
+        return os.path.getsize(filename)
+
+
+class ResourceManager:
+    '''
+    Per-kind LRU caches bounded by an approximate byte budget. Assets that
+    the current scene needs can be pinned so they are never evicted.
+    '''
+
+    def __init__(self, budgets=BUDGETS):
+        self.caches = {
+            kind: cache.LRUCache(budget)
+            for kind, budget in budgets.items()
+        }
+
+    def get(self, kind, filename, load):
+        resources = self.caches[kind]
+        if filename in resources:
+            return resources.get(filename, load)
+        resources.misses += 1
+        handle = load()
+        resources.put(filename, handle, estimate_size(kind, filename, handle))
+        return handle
+
+    def contains(self, kind, filename):
+        return filename in self.caches[kind]
+
+    def pin(self, assets):
+        for kind, resources in self.caches.items():
+            resources.pin(filename for k, filename in assets if k == kind)
+
+    def clear(self, kind):
+        self.caches[kind].clear()
+
+    def stats(self):
+        return {
+            kind: resources.stats()
+            for kind, resources in self.caches.items()
+        }
@@ -1,4 +1,5 @@
-import functools
+import argparse
+import collections
 import importlib
 import os
 import time
@@ -9,6 +10,18 @@ import pyxelen
 import model
 
 # These are hot-reloadable (Stateless)
+import animation
+import atlas
+import batch
+import cache
+import governor
+import mixer
+import preload
+import profiler
+import resources
+import selector
+import streaming
+import threaded
 import view
 import screens
 
@@ -16,19 +29,106 @@ import screens
 TITLE = 'Runia Chronicles'
 WIDTH = 512
 HEIGHT = 288
+TEXT_CACHE_BYTES = 4 * 1024 * 1024
+LAYOUT_CACHE_SIZE = 512
+LAYER_CACHE_BYTES = 8 * 1024 * 1024
+# Decode music in chunks into a ring buffer instead of loading whole
+# tracks. Needs soundfile and a backend with audio.open_stream, which
+# pyxelen does not have: only the headless backend can stream. Off by
+# default, --stream-music turns it on and says why if it cannot.
+STREAM_MUSIC = False
+# Re-present the last frame instead of redrawing it when nothing changed
+RETAINED = True
+# Frames per second of the main loop
+FPS = 30
+# With --tick-rate the simulation runs at a fixed rate instead, catching up
+# on at most this many seconds per frame, however many ticks that takes.
+# Time beyond it, from a stall or ticks slower than real time, is dropped,
+# which slows the game down rather than spiralling.
+MAX_FRAME_TIME = 0.25
+# Key press to presented frame times kept for reporting
+LATENCY_SAMPLES = 1000
+# Show the frame profiler overlay, and write its frames to a CSV file
+PROFILER_KEY = pyxelen.Key.F3
+PROFILE_DUMP_KEY = pyxelen.Key.F4
+# Run cProfile over the next CAPTURE_CALLS frames and key presses. Setting
+# the environment variable to a number of calls starts one at launch.
+CAPTURE_KEY = pyxelen.Key.F5
+CAPTURE_CALLS = 300
+CAPTURE_ENV = 'RUNIA_PROFILE'
 
 
 class EventHandler:
 
-    def __init__(self, pyxelen):
+    def __init__(self, pyxelen, stream_music=STREAM_MUSIC):
         self.pyxelen = pyxelen
         self.width = WIDTH
         self.height = HEIGHT
         self.music_playing = ""
+        self.stream_music = False
+        if stream_music:
+            reason = streaming.unsupported(self.pyxelen.audio)
+            if reason is None:
+                self.stream_music = True
+            else:
+                print(f'Not streaming music: {reason}')
+        self.music_stream = None
+        self.mixer = mixer.Mixer(self.pyxelen.audio)
         self.window = self.pyxelen.open_window(TITLE, WIDTH, HEIGHT)
         self.renderer = self.window.create_renderer()
         self.buffer = self.renderer.create_texture(WIDTH, HEIGHT)
+        self.batch = batch.SpriteBatch()
+        self.atlas = atlas.load()
+        self.resources = resources.ResourceManager()
+        self.pinned = None
+        self.preloader = preload.Preloader(
+            {} if self.stream_music else {'music': self.pyxelen.audio.load_music},
+            self.resources.contains,
+            # Only some renderers can decode off the render thread
+            getattr(self.renderer, 'decode_image', None)
+        )
+        self.layouts = cache.LRUCache(LAYOUT_CACHE_SIZE)
+        self.text_runs = cache.LRUCache(
+            TEXT_CACHE_BYTES,
+            weigh=lambda run: run[1].w * run[1].h * 4
+        )
+        self.layers = cache.LRUCache(
+            LAYER_CACHE_BYTES,
+            weigh=lambda layer: WIDTH * HEIGHT * 4
+        )
         self.state = model.initial_model
+        self.clock = time.perf_counter
+        self.timeline = animation.Timeline(self.clock)
+        # Fixed simulation rate in Hz, or None for one update per frame
+        self.tick_rate = None
+        # Cap on frames drawn per second, or None to draw every frame
+        self.render_rate = None
+        self.last_frame = None
+        self.last_render = None
+        self.lag = 0.0
+        self.ticks = 0
+        self.dropped_ticks = 0
+        self.frames_skipped = 0
+        # Lowers the work rate on static screens, None to always run
+        self.governor = governor.Governor(clock=self.clock)
+        self.frames_idle = 0
+        # Runs the game rules on another thread when started, see threaded.py
+        self.simulation = None
+        self.received = 0
+        self.input_at = None
+        self.input_latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.retained = RETAINED
+        self.drawn = None
+        self.frames_drawn = 0
+        self.frames_reused = 0
+        # Selector recomputations and model.Record allocations in the last frame
+        self.recomputes = 0
+        self.allocations = 0
+        # Phase timings, only taken while profiling, see profiler.py
+        self.profiler = profiler.FrameProfiler(clock=self.clock)
+        self.profiling = False
+        # cProfile capture in progress, or None
+        self.capture = None
 
     @property
     def screen(self):
@@ -36,23 +136,58 @@ class EventHandler:
 
     def reload(self):
         importlib.reload(screens)
-        self._to_sprites.cache_clear()
-        self.load_image.cache_clear()
+        self.atlas = atlas.load()
+        self.resources.clear('image')
+        self.layouts.clear()
+        self.text_runs.clear()
+        self.layers.clear()
+        self.drawn = None
 
-    @functools.lru_cache()
     def load_music(self, filename):
-        return self.pyxelen.audio.load_music(filename)
+        return self.resources.get(
+            'music', filename, lambda: self._load_music(filename)
+        )
+
+    def _load_music(self, filename):
+        music = self.preloader.take('music', filename)
+        if music is None:
+            music = self.pyxelen.audio.load_music(filename)
+        return music
 
-    @functools.lru_cache()
     def load_effect(self, filename):
-        return self.pyxelen.audio.load_effect(filename)
+        return self.resources.get(
+            'effect', filename,
+            lambda: self.pyxelen.audio.load_effect(filename)
+        )
 
-    @functools.lru_cache()
     def load_image(self, filename):
-        return self.renderer.create_texture_from_image(filename)
+        return self.resources.get(
+            'image', filename, lambda: self._load_image(filename)
+        )
+
+    def _load_image(self, filename):
+        texture = self.preloader.take('image', filename)
+        if texture is None:
+            texture = self.renderer.create_texture_from_image(filename)
+        return texture
+
+    def upload_image(self, filename, pixels):
+        if pixels is None:
+            return self.renderer.create_texture_from_image(filename)
+        return self.renderer.create_texture_from_pixels(pixels)
 
-    @functools.lru_cache()
-    def _to_sprites(self, font, text, x, y, centered):
+    def pin_resources(self):
+        # Only recompute the pins when the scene or its music changes
+        scene = self.state.scene
+        key = type(scene), getattr(scene, 'next_scene', None), self.state.music
+        if key == self.pinned:
+            return
+        self.pinned = key
+        self.resources.pin(
+            list(preload.scene_assets(scene)) + [('music', self.state.music)]
+        )
+
+    def _layout(self, font, text, centered):
         if centered:
             offset_x = 0
             for c in text:
@@ -64,48 +199,200 @@ class EventHandler:
         else:
             offset_x = 0
             offset_y = 0
-        results = []
+        glyphs = []
+        advance = 0
         for c in text:
             if c in font.glyphs:
-                results.append(
+                glyphs.append(
                     (
                         font.glyphs[c],
                         view.Box(
-                            x + offset_x,
-                            y + offset_y + font.offsets[c][1],
+                            advance,
+                            font.offsets[c][1],
                             font.size_x,
                             font.size_y
                         )
                     )
                 )
-            offset_x += font.offsets.get(
+            advance += font.offsets.get(
                 c, (int(font.size_x / 2), 0)
             )[0]
-        return results
+        return offset_x, offset_y, glyphs
 
-    def draw_sprite(self, image, dest):
-        clip = image.clip
-        self.renderer.copy(
-            self.load_image(image.filename),
-            clip.x, clip.y, clip.w, clip.h,
-            dest.x, dest.y, dest.w, dest.h
+    def layout(self, font, text, centered):
+        return self.layouts.get(
+            (font, text, centered),
+            lambda: self._layout(font, text, centered)
         )
 
-    def draw_text(self, font, text, x, y, centered):
-        sprites = self._to_sprites(font, text, x, y, centered)
+    def cache_stats(self):
+        return {
+            'layouts': self.layouts.stats(),
+            'text_runs': self.text_runs.stats(),
+            'layers': self.layers.stats(),
+            'selectors': selector.stats(),
+        }
+
+    def texture(self, image):
+        if self.atlas is not None:
+            image = self.atlas.resolve(image)
+        return self.load_image(image.filename), image.clip
+
+    def draw_sprite(self, image, dest):
+        texture, clip = self.texture(image)
+        self.batch.add(texture, clip, dest)
+
+    def _render_text_run(self, font, text):
+        _, _, sprites = self.layout(font, text, False)
+        w = max(dest.x + dest.w for _, dest in sprites)
+        h = max(dest.y + dest.h for _, dest in sprites)
+        texture = self.renderer.create_texture(w, h)
+
+        target = self.renderer.target
+        draw_color = self.renderer.draw_color
+        self.renderer.target = texture
+        self.renderer.draw_color = 0, 0, 0, 0
+        self.renderer.clear()
         for image, dest in sprites:
-            self.draw_sprite(image, dest)
+            sheet, clip = self.texture(image)
+            self.renderer.copy(
+                sheet,
+                clip.x, clip.y, clip.w, clip.h,
+                dest.x, dest.y, dest.w, dest.h
+            )
+        self.renderer.target = target
+        self.renderer.draw_color = draw_color
+        return texture, view.Box(0, 0, w, h)
+
+    def draw_text(self, font, text, x, y, centered):
+        offset_x, offset_y, glyphs = self.layout(font, text, centered)
+        if not glyphs:
+            return
+        texture, clip = self.text_runs.get(
+            (font, text),
+            lambda: self._render_text_run(font, text)
+        )
+        self.batch.add(
+            texture, clip,
+            view.Box(x + offset_x, y + offset_y, clip.w, clip.h)
+        )
+
+    def _render_layer(self, draw):
+        # Anything queued so far belongs underneath the layer
+        self.batch.flush(self.renderer)
+
+        texture = self.renderer.create_texture(WIDTH, HEIGHT)
+        target = self.renderer.target
+        draw_color = self.renderer.draw_color
+        self.renderer.target = texture
+        self.renderer.draw_color = 0, 0, 0, 0
+        self.renderer.clear()
+        draw(self)
+        self.batch.flush(self.renderer)
+        self.renderer.target = target
+        self.renderer.draw_color = draw_color
+        return texture
+
+    def draw_layer(self, key, draw):
+        '''
+        Draw a full-screen layer that only depends on key. The layer is
+        composited into a texture the first time the key is seen and blitted
+        from the cache afterwards, so key must include every input draw uses.
+        '''
+        texture = self.layers.get(key, lambda: self._render_layer(draw))
+        self.batch.add(texture, view.FULLSCREEN, view.FULLSCREEN)
 
     def play_music(self, filename):
-        music = self.load_music(filename)
-        self.pyxelen.audio.play_music(music)
+        if self.stream_music:
+            if self.music_stream is not None:
+                self.music_stream.close()
+            self.music_stream = streaming.MusicStream(
+                filename, self.pyxelen.audio, self.state.music_volume
+            )
+        else:
+            music = self.load_music(filename)
+            self.pyxelen.audio.play_music(music)
         self.music_playing = filename
 
     def play_effect(self, filename):
         effect = self.load_effect(filename)
         self.pyxelen.audio.play_effect(effect, self.state.effects_volume)
 
+    def start_simulation(self, tick_rate):
+        self.simulation = threaded.Simulation(
+            self.state, lambda state: screens.screens[state.scene.screen], tick_rate,
+            self.clock
+        )
+        self.simulation.start()
+
+    def stop_simulation(self):
+        self.simulation.stop()
+        self.simulation = None
+
+    def close(self):
+        '''
+        Stops the background threads.
+        '''
+        if self.simulation is not None:
+            self.stop_simulation()
+        self.preloader.close()
+        if self.music_stream is not None:
+            self.music_stream.close()
+            self.music_stream = None
+
+    def receive(self):
+        published = self.simulation.mailbox.take()
+        if published.number != self.received:
+            self.received = published.number
+            self.state = published.state
+            if published.input_at is not None and self.input_at is None:
+                self.input_at = published.input_at
+        self.timeline.advance()
+
+    def start_capture(self, calls=CAPTURE_CALLS):
+        print(f'Profiling the next {calls} calls')
+        self.capture = profiler.Capture(calls)
+
+    def finish_capture(self):
+        capture = self.capture
+        self.capture = None
+        filename = time.strftime('profile-%Y%m%d-%H%M%S.prof')
+        capture.dump(filename)
+        capture.report({module.__name__ for module in screens.screens.values()})
+        print(f'Wrote {filename}')
+
+    def captured(self, function, *args):
+        if self.capture.call(function, *args):
+            self.finish_capture()
+
     def on_key_down(self, window, key, modifiers, repeat):
+        if self.capture is not None:
+            self.captured(self.key_down, key)
+        else:
+            self.key_down(key)
+
+    def key_down(self, key):
+        if self.governor is not None:
+            self.governor.wake()
+            if self.simulation is not None:
+                self.simulation.throttle(None)
+        if key == PROFILER_KEY:
+            self.profiling = not self.profiling
+            # Start a fresh run, the gap would read as one long frame
+            self.profiler = profiler.FrameProfiler(clock=self.clock)
+            return
+        if key == PROFILE_DUMP_KEY:
+            self.dump_profile()
+            return
+        if key == CAPTURE_KEY:
+            if self.capture is None:
+                self.start_capture()
+            return
+        if self.simulation is not None:
+            self.simulation.send(key)
+            return
+        if self.input_at is None:
+            self.input_at = self.clock()
         try:
             new_state = self.screen.on_key_down(key, self.state)
             assert isinstance(new_state, model.Model)
@@ -115,30 +402,135 @@ class EventHandler:
             # self.reload()
 
     def process_audio(self):
-        self.pyxelen.audio.set_music_volume(self.state.music_volume)
+        volume = self.state.music_volume
+        if self.mixer.set_music_volume(volume) and self.music_stream is not None:
+            self.music_stream.volume = volume
         if self.music_playing != self.state.music:
             self.play_music(self.state.music)
-        for filename in self.state.effects:
-            self.play_effect(filename)
-        self.state = self.state.clear_effects()
+        if self.simulation is not None:
+            effects = self.simulation.take_effects()
+            if effects:
+                self.mixer.play_effects(effects, self.play_effect)
+        # Most frames queue no effects, so avoid building a new Model
+        elif self.state.effects:
+            self.mixer.play_effects(self.state.effects, self.play_effect)
+            self.state = self.state.clear_effects()
 
     def on_update_and_render(self):
+        if self.capture is not None:
+            self.captured(self.update_and_render)
+        else:
+            self.update_and_render()
+
+    def update_and_render(self):
+        if self.governor is not None and not self.governor.due():
+            self.frames_idle += 1
+            # Nothing happened in the skipped time, so nothing to catch up on
+            self.last_frame = self.clock()
+            return
+        allocations = model.allocation_count()
+        state = self.state
+        started = self.timeline.started
+        profiling = self.profiling
         try:
+            if profiling:
+                self.profiler.begin_frame()
             # self.reload()
-            new_state = self.screen.on_update(self.state)
-            assert isinstance(new_state, model.Model)
-            self.state = new_state
-            self.render()
+            if self.simulation is not None:
+                self.receive()
+            elif self.tick_rate:
+                self.fixed_update()
+            else:
+                self.timeline.advance()
+                self.update()
+            if profiling:
+                self.profiler.lap('update')
+            self.preloader.prefetch(self.state.scene)
+            self.pin_resources()
+            if profiling:
+                self.profiler.lap('other')
+            if self.render_due():
+                self.render()
+            else:
+                self.frames_skipped += 1
             self.process_audio()
+            if profiling:
+                self.profiler.lap('audio')
+            self.preloader.pump(self.upload_image)
+            self.recomputes = selector.end_frame()
+            self.allocations = model.allocation_count() - allocations
+            if profiling:
+                self.profiler.end_frame(
+                    self.batch.last_batches, self.batch.last_copies,
+                    self.cache_stats()
+                )
+            if self.governor is not None:
+                if self.state is state and not self.timeline.active and self.timeline.started == started:
+                    self.governor.idle()
+                else:
+                    self.governor.wake()
+                if self.simulation is not None:
+                    self.simulation.throttle(self.governor.rate)
         except Exception:
             traceback.print_exc()
 
-    def render(self):
-        self.renderer.target = self.buffer
-        self.renderer.draw_color = 0, 0, 0, 255
-        self.renderer.clear()
+    def update(self):
+        new_state = self.screen.on_update(self.state)
+        assert isinstance(new_state, model.Model)
+        self.state = new_state
+        self.ticks += 1
 
-        self.screen.view(self, self.state)
+    def fixed_update(self):
+        '''
+        Runs one update per 1 / tick_rate seconds of real time since the
+        last frame, up to MAX_FRAME_TIME worth of them, and leaves the
+        remainder for the animations to interpolate with.
+        '''
+        tick = 1 / self.tick_rate
+        now = self.clock()
+        if self.last_frame is not None:
+            elapsed = now - self.last_frame
+            if elapsed > MAX_FRAME_TIME:
+                self.dropped_ticks += int((elapsed - MAX_FRAME_TIME) / tick)
+                elapsed = MAX_FRAME_TIME
+            self.lag += elapsed
+        self.last_frame = now
+        ticks = 0
+        while self.lag >= tick:
+            self.update()
+            self.lag -= tick
+            ticks += 1
+        self.timeline.advance(ticks * tick)
+        self.timeline.lead = self.lag
+
+    def render_due(self):
+        if not self.render_rate:
+            return True
+        now = self.clock()
+        # Allow a little early so a cap equal to the loop rate draws every frame
+        if self.last_render is not None and now - self.last_render < 0.9 / self.render_rate:
+            return False
+        self.last_render = now
+        return True
+
+    def render(self):
+        # Model is immutable, so an equal state draws an identical buffer.
+        # The window size is included because some backends lose the
+        # contents of render targets when the window is resized. Running
+        # animations are not part of the state, so they force a redraw.
+        self.batch.begin_frame()
+        frame = self.state, self.window.size
+        if self.drawn is not None and self.drawn[1] != frame[1]:
+            self.resized()
+        # The overlay changes every frame, so is never reused
+        if self.retained and self.drawn == frame and not self.timeline.moving and not self.profiling:
+            self.frames_reused += 1
+        else:
+            self.draw_buffer()
+            self.drawn = frame
+            self.frames_drawn += 1
+        if self.profiling:
+            self.profiler.lap('view')
 
         self.renderer.target = None
         self.renderer.copy(
@@ -147,6 +539,44 @@ class EventHandler:
             *self.offset, *self.scaled_size
         )
         self.renderer.present()
+        if self.profiling:
+            self.profiler.lap('present')
+        if self.input_at is not None:
+            self.input_latencies.append(self.clock() - self.input_at)
+            self.input_at = None
+
+    def resized(self):
+        # The cached text runs, layers and overlay are render targets too,
+        # so they may have been lost with the buffer
+        self.text_runs.clear()
+        self.layers.clear()
+        self.profiler.overlay = None
+
+    def draw_buffer(self):
+        self.renderer.target = self.buffer
+        self.renderer.draw_color = 0, 0, 0, 255
+        self.renderer.clear()
+
+        self.timeline.begin_draw()
+        self.screen.view(self, self.state)
+        if self.profiling:
+            # Kept out of the view time, the overlay is not cheap to draw
+            self.profiler.lap('view')
+            self.draw_profiler()
+            self.profiler.lap('overlay')
+        self.batch.flush(self.renderer)
+
+    def draw_profiler(self):
+        # Drawing the overlay costs more than most screens, so it is only
+        # redrawn a few times a second and blitted in between
+        if self.profiler.overlay_due():
+            self.profiler.overlay = self._render_layer(self.profiler.draw)
+        self.batch.add(self.profiler.overlay, view.FULLSCREEN, view.FULLSCREEN)
+
+    def dump_profile(self):
+        filename = time.strftime('profile-%Y%m%d-%H%M%S.csv')
+        self.profiler.dump(filename)
+        print(f'Wrote {len(self.profiler.frames)} frames to {filename}')
 
     @property
     def size(self):
@@ -176,11 +606,88 @@ class EventHandler:
         return int(self.width * scale), int(self.height * scale)
 
 
+def capture_calls(value):
+    '''
+    Calls to profile for the CAPTURE_ENV setting: a number of calls, with
+    0 or less meaning off, or anything else that is set meaning
+    CAPTURE_CALLS.
+    '''
+    if not value:
+        return None
+    try:
+        calls = int(value)
+    except ValueError:
+        print(f'{CAPTURE_ENV}={value} is not a number of calls, profiling {CAPTURE_CALLS}')
+        return CAPTURE_CALLS
+    if calls <= 0:
+        return None
+    return calls
+
+
 def main():
-    pyxelen.init()
-    platform = pyxelen.Pyxelen()
-    handler = EventHandler(platform)
-    platform.run(handler, 30)
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument(
+        '--headless', action='store_true',
+        help='run without a window or audio device'
+    )
+    parser.add_argument(
+        '--frames', type=int, default=None,
+        help='stop after this many frames (headless only)'
+    )
+    parser.add_argument(
+        '--tick-rate', type=float, default=None,
+        help='run the game at this fixed rate in Hz instead of once per frame'
+    )
+    parser.add_argument(
+        '--fps', type=float, default=FPS,
+        help=f'main loop frames per second (default {FPS})'
+    )
+    parser.add_argument(
+        '--render-rate', type=float, default=None,
+        help='draw at most this many frames per second, below --fps on slow hosts'
+    )
+    parser.add_argument(
+        '--verbose', action='store_true',
+        help='print the time spent at each idle frame rate on exit'
+    )
+    parser.add_argument(
+        '--stream-music', action='store_true', default=STREAM_MUSIC,
+        help='stream music instead of loading whole tracks (needs soundfile'
+             ' and a backend with open_stream, i.e. --headless)'
+    )
+    parser.add_argument(
+        '--threaded', action='store_true',
+        help='run the game rules on their own thread, at --tick-rate or the frame rate'
+    )
+    args = parser.parse_args()
+    fps = args.fps
+
+    if args.headless:
+        import headless
+        platform = headless.Pyxelen()
+    else:
+        pyxelen.init()
+        platform = pyxelen.Pyxelen()
+    handler = EventHandler(platform, args.stream_music)
+    handler.render_rate = args.render_rate
+    calls = capture_calls(os.environ.get(CAPTURE_ENV))
+    if calls:
+        handler.start_capture(calls)
+    if args.threaded:
+        handler.start_simulation(args.tick_rate or fps)
+    else:
+        handler.tick_rate = args.tick_rate
+    if args.headless:
+        platform.run(handler, fps, args.frames)
+    else:
+        platform.run(handler, fps)
+    handler.close()
+    if handler.capture is not None:
+        # Stopped before the capture was complete
+        handler.finish_capture()
+    if args.verbose:
+        for tier, seconds in handler.governor.report():
+            print(f'{tier:<12}{seconds:8.1f}s')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,94 @@
+'''
+Values derived from a Model, computed once per Model object.
+
+A selector is a function of the state alone. Its result is cached against
+the identity of the state and dropped when the state is garbage collected,
+so screen code can call it as often as it likes while drawing a frame.
+Equal but distinct states are computed separately, because comparing
+Models structurally costs more than most selectors do. A selector must not
+return the state itself, or the state would never be collected.
+
+(The module is not called selectors.py because that would shadow the
+standard library module multiprocessing depends on.)
+'''
+import collections
+import functools
+import weakref
+
+
+class SelectorCache:
+
+    def __init__(self):
+        # id(state) -> (weak reference to the state, {selector: value})
+        self.states = {}
+        self.recomputes = collections.Counter()
+        self.frame_recomputes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def values(self, state):
+        key = id(state)
+        entry = self.states.get(key)
+        if entry is None or entry[0]() is not state:
+            entry = weakref.ref(state, functools.partial(self.forget, key)), {}
+            self.states[key] = entry
+        return entry[1]
+
+    def forget(self, key, ref):
+        entry = self.states.get(key)
+        if entry is not None and entry[0] is ref:
+            del self.states[key]
+            self.evictions += 1
+
+    def select(self, function, state):
+        values = self.values(state)
+        try:
+            value = values[function]
+            self.hits += 1
+        except KeyError:
+            value = values[function] = function(state)
+            self.misses += 1
+            self.frame_recomputes += 1
+            self.recomputes[function.__module__ + '.' + function.__name__] += 1
+        return value
+
+    def end_frame(self):
+        '''
+        Returns the number of recomputations since the last call.
+        '''
+        recomputes = self.frame_recomputes
+        self.frame_recomputes = 0
+        return recomputes
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.states),
+            'recomputes': dict(self.recomputes),
+        }
+
+
+cache = SelectorCache()
+
+
+def selector(function):
+    @functools.wraps(function)
+    def select(state):
+        return cache.select(function, state)
+    return select
+
+
+def reset():
+    global cache
+    cache = SelectorCache()
+
+
+def end_frame():
+    return cache.end_frame()
+
+
+def stats():
+    return cache.stats()
@@ -0,0 +1,298 @@
+'''
+Headless Monte Carlo battle simulator.
+
+Runs a model.Battle to completion with the real Action.apply logic and the
+turn rules in battle.on_update / battle.next_turn, with the players driven
+by a policy instead of the keyboard. The compact engine plays the same
+rules on a compact.CompactBattle and is much faster:
+
+    python simulate.py SHIH_TZU_BATTLE --policy greedy -n 10000
+'''
+import argparse
+import collections
+import concurrent.futures
+import functools
+import os
+import random
+import statistics
+import time
+
+import model
+import battle
+import compact
+import distributions
+
+
+MAX_TURNS = 500
+
+# (quantity, size, advantage, disadvantage) passed to utils.roll
+ROLLS = {
+    model.SlashAction: (1, 10, 2, 0),
+    model.FireboltAction: (1, 10, 0, 0),
+    model.ThunderCannonAction: (2, 6, 0, 0),
+    model.PunchAction: (1, 6, 0, 0),
+    model.BiteAction: (1, 4, 0, 0),
+    model.EngulfAction: (2, 6, 0, 0),
+    model.HealAction: (1, 4, 0, 0),
+}
+FIREBALL_ROLL = (1, 10, 0, 1)
+STABILIZE_HEALING = 3
+
+
+@functools.lru_cache(maxsize=None)
+def kick_damage(size):
+    if size == compact.SMALL:
+        return distributions.expected_damage(1, 6, 2)
+    elif size == compact.LARGE:
+        return distributions.expected(distributions.amount_pmf(
+            distributions.explode_pmf(1, 20, disadvantage=1)
+        ))
+    elif size == compact.MEDIUM:
+        return distributions.expected_damage(1, 6)
+    else:
+        return 0
+
+
+@functools.lru_cache(maxsize=None)
+def expected_damage(action):
+    return distributions.expected_damage(
+        *(FIREBALL_ROLL if action is model.FireballAction else ROLLS[action])
+    )
+
+
+# Which side each action targets, looked up once instead of issubclass()
+# per candidate
+ENEMY, FRIEND, NONE = range(3)
+TARGETS = [
+    ENEMY if issubclass(action, model.TargetEnemyAction)
+    else FRIEND if issubclass(action, model.TargetFriendlyAction)
+    else NONE
+    for action in compact.ACTIONS
+]
+
+
+def expected_value(battle, action, target):
+    '''
+    Expected hit points taken from enemies or given to friends, not counting
+    damage beyond what the targets have left.
+    '''
+    # Friends come first, so a side's target is its offset from the start
+    health = battle.health
+    friends = battle.friends
+    if action is model.FireballAction:
+        damage = expected_damage(action)
+        return sum(min(damage, h) for h in health[friends:])
+    elif action is model.KickAction:
+        i = friends + target
+        return min(kick_damage(battle.size[i]), health[i])
+    elif action is model.StabilizeAction:
+        return STABILIZE_HEALING * 2 if health[target] <= 0 else 0
+    elif action is model.HealAction:
+        missing = battle.max_health[target] - health[target]
+        return min(expected_damage(action), missing)
+    elif issubclass(action, model.TargetEnemyAction):
+        return min(expected_damage(action), health[friends + target])
+    else:
+        return 0
+
+
+def candidates(battle):
+    '''
+    Yields (slot, action class, target) for the active character, where slot
+    indexes its action list and target indexes the side the action targets.
+    '''
+    health = battle.health
+    friends = battle.friends
+    for slot, action_id in enumerate(battle.actions[battle.active()]):
+        action = compact.ACTIONS[action_id]
+        side = TARGETS[action_id]
+        if side == ENEMY:
+            for target in range(len(health) - friends):
+                if health[friends + target] > 0:
+                    yield slot, action, target
+        elif side == FRIEND:
+            for target in range(friends):
+                yield slot, action, target
+        else:
+            yield slot, action, 0
+
+
+def random_policy(battle):
+    slot, _, target = random.choice(list(candidates(battle)))
+    return slot, target
+
+
+def greedy_policy(battle):
+    # max() over candidates by expected_value, without the key function
+    # call per candidate. Ties go to the first, as with max().
+    best = None
+    best_value = None
+    for slot, action, target in candidates(battle):
+        value = expected_value(battle, action, target)
+        if best is None or value > best_value:
+            best = slot, target
+            best_value = value
+    return best
+
+
+POLICIES = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+}
+
+
+def waiting_for_player(state):
+    # The state in which battle.on_update leaves the turn to the keyboard
+    return (
+        battle.choosing_action(state) and
+        not battle.active_character(state).is_dead and
+        not battle.all_players_dead(state) and
+        not battle.all_enemies_dead(state)
+    )
+
+
+def fight_model(scene, policy, seed, max_turns=MAX_TURNS):
+    '''
+    Returns (outcome, turns, party health) where outcome is 'won', 'lost'
+    or 'timeout'.
+    '''
+    random.seed(seed)
+    state = model.initial_model.enter_scene(scene)
+    turns = 0
+    while turns < max_turns:
+        state = battle.on_update(state)
+        if state.effects:
+            state = state.clear_effects()
+        if isinstance(state.scene, model.GameOver):
+            return 'lost', turns, [c.health for c in battle.friends(state)]
+        elif not isinstance(state.scene, model.Battle):
+            return 'won', turns, [c.health for c in battle.friends(state)]
+        elif battle.pending_action(state):
+            state = battle.next_turn(battle.action(state).result)
+            turns += 1
+        elif waiting_for_player(state):
+            slot, target = policy(compact.CompactBattle.from_model(state))
+            act = battle.active_character(state).actions[slot]
+            if isinstance(act, model.TargetAction):
+                act = act.set(target=target)
+            state = battle.set_action(state, act)
+            if battle.targeting(state):
+                state = battle.queue_action(state)
+    return 'timeout', turns, [c.health for c in battle.friends(state)]
+
+
+def fight_compact(scene, policy, seed, max_turns=MAX_TURNS):
+    '''
+    Same rules as fight_model on a CompactBattle. The same seed gives the
+    same battle.
+    '''
+    random.seed(seed)
+    combat = compact.CompactBattle.from_model(model.initial_model.set(scene=scene))
+    enemy_turn = isinstance(scene.action, model.EnemyAction)
+    turns = 0
+
+    def next_turn():
+        upcoming = combat.upcoming()
+        combat.next_turn()
+        return combat.is_enemy(upcoming)
+
+    while turns < max_turns:
+        combat.remove_dead_enemies()
+        active = combat.active()
+        party = combat.health[:combat.friends]
+        if combat.is_dead(active):
+            enemy_turn = next_turn()
+            continue
+        elif all(h <= 0 for h in party):
+            return 'lost', turns, party
+        elif all(combat.is_dead(i) for i in combat.enemy_indexes):
+            return 'won', turns, party
+        elif enemy_turn:
+            action_id = random.choice(combat.actions[active])
+            target = 0
+            if issubclass(compact.ACTIONS[action_id], model.TargetAction):
+                target = compact.select_target(combat)
+        else:
+            slot, target = policy(combat)
+            action_id = combat.actions[active][slot]
+        compact.apply(combat, action_id, target)
+        enemy_turn = next_turn()
+        turns += 1
+    return 'timeout', turns, combat.health[:combat.friends]
+
+
+ENGINES = {
+    'compact': fight_compact,
+    'model': fight_model,
+}
+
+
+def fight_many(battle_name, policy_name, engine, seeds):
+    scene = getattr(model, battle_name)
+    policy = POLICIES[policy_name]
+    fight = ENGINES[engine]
+    return [fight(scene, policy, seed) for seed in seeds]
+
+
+def simulate(battle_name, policy_name, battles, workers=None, seed=0,
+             engine='compact', chunk=250):
+    seeds = random.Random(seed).sample(range(2 ** 32), battles)
+    chunks = [seeds[i:i + chunk] for i in range(0, battles, chunk)]
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(fight_many, battle_name, policy_name, engine, seeds)
+            for seeds in chunks
+        ]
+        return [r for future in futures for r in future.result()]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def report(results, elapsed):
+    outcomes = collections.Counter(outcome for outcome, _, _ in results)
+    turns = [t for _, t, _ in results]
+    print(f'battles     {len(results)} in {elapsed:.1f}s ({len(results) / elapsed:.0f}/s)')
+    for outcome in ('won', 'lost', 'timeout'):
+        print(f'{outcome:<12}{outcomes[outcome] / len(results):.1%}')
+    print(
+        f'turns       mean {statistics.mean(turns):.1f}  p50 {percentile(turns, 0.5)}'
+        f'  p90 {percentile(turns, 0.9)}  max {max(turns)}'
+    )
+    names = [c.name for c in model.CHARACTERS]
+    for i, name in enumerate(names):
+        health = [hp[i] for _, _, hp in results]
+        print(
+            f'{name:<12}mean {statistics.mean(health):.1f}  p10 {percentile(health, 0.1)}'
+            f'  p50 {percentile(health, 0.5)}  down {sum(1 for h in health if h == 0) / len(health):.1%}'
+        )
+
+
+def main():
+    battles = [
+        name for name, value in vars(model).items()
+        if isinstance(value, model.Battle)
+    ]
+    parser = argparse.ArgumentParser(description='Monte Carlo battle simulator')
+    parser.add_argument('battle', choices=battles)
+    parser.add_argument('--policy', choices=list(POLICIES), default='random')
+    parser.add_argument('-n', '--battles', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--engine', choices=list(ENGINES), default='compact',
+        help='compact struct-of-arrays state, or the pyrsistent Model'
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = simulate(
+        args.battle, args.policy, args.battles, args.workers, args.seed, args.engine
+    )
+    report(results, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
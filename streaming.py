@@ -0,0 +1,181 @@
+import threading
+import traceback
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+CHUNK_FRAMES = 4096
+# About 1.5 seconds of 44.1 kHz 16-bit stereo
+BUFFER_BYTES = 256 * 1024
+
+
+def unsupported(audio):
+    '''
+    Why music cannot be streamed on audio, or None if it can. Streaming
+    needs a decoder (soundfile) and a backend that can play raw PCM
+    through audio.open_stream(frequency, channels, callback). pyxelen has
+    no such call, so of the backends here only headless.Audio streams.
+    '''
+    if soundfile is None:
+        return 'soundfile is not installed'
+    if not hasattr(audio, 'open_stream'):
+        return 'the audio backend cannot play raw PCM (no open_stream)'
+    return None
+
+
+def supported(audio):
+    return unsupported(audio) is None
+
+
+class RingBuffer:
+    '''
+    Fixed-size byte ring buffer shared by one writer and one reader thread.
+    write() blocks while the buffer is full. read() never blocks.
+    '''
+
+    def __init__(self, capacity):
+        self.data = bytearray(capacity)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, chunk):
+        view = memoryview(chunk)
+        while view:
+            with self.condition:
+                while self.size == self.capacity and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                end = (self.start + self.size) % self.capacity
+                n = min(len(view), self.capacity - self.size, self.capacity - end)
+                self.data[end:end + n] = view[:n]
+                self.size += n
+            view = view[n:]
+
+    def read(self, n):
+        with self.condition:
+            n = min(n, self.size)
+            first = min(n, self.capacity - self.start)
+            result = bytes(self.data[self.start:self.start + first])
+            result += bytes(self.data[:n - first])
+            self.start = (self.start + n) % self.capacity
+            self.size -= n
+            self.condition.notify()
+        return result
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class SoundFileDecoder:
+
+    def __init__(self, filename):
+        self.file = soundfile.SoundFile(filename)
+        self.frequency = self.file.samplerate
+        self.channels = self.file.channels
+
+    def read(self):
+        return self.file.read(CHUNK_FRAMES, dtype='int16').tobytes()
+
+    @property
+    def decoded_bytes(self):
+        '''
+        Size of the whole track as 16-bit PCM, what a fully decoded copy
+        keeps resident.
+        '''
+        return self.file.frames * self.channels * 2
+
+    def rewind(self):
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+
+class MusicStream:
+    '''
+    Plays one looping track by decoding it in chunks on a background thread
+    into a ring buffer. Playback starts once the first chunk is buffered,
+    and only the ring buffer stays resident no matter how long the track is.
+
+    started is set once playback starts, or once decoding stops without it
+    starting (a decoder error or a track with no audio), so waiting on it
+    never hangs. playing tells the two apart.
+    '''
+
+    def __init__(self, filename, audio, volume, decoder=SoundFileDecoder,
+                 buffer_bytes=BUFFER_BYTES):
+        self.filename = filename
+        self.audio = audio
+        self.stream = None
+        self.volume = volume
+        self.decoder = decoder(filename)
+        self.buffer = RingBuffer(buffer_bytes)
+        self.started = threading.Event()
+        self.thread = threading.Thread(
+            target=self.decode, name='music', daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, volume):
+        self._volume = volume
+        if self.stream is not None:
+            self.stream.volume = volume
+
+    @property
+    def playing(self):
+        return self.stream is not None
+
+    @property
+    def resident_bytes(self):
+        return self.buffer.capacity
+
+    def pull(self, n):
+        # Called from the audio device; pad underruns with silence
+        data = self.buffer.read(n)
+        return data + bytes(n - len(data))
+
+    def decode(self):
+        try:
+            empty = False
+            while not self.buffer.closed:
+                chunk = self.decoder.read()
+                if not chunk:
+                    # Loop the track, unless it has no audio at all
+                    if empty:
+                        break
+                    empty = True
+                    self.decoder.rewind()
+                    continue
+                empty = False
+                self.buffer.write(chunk)
+                if self.stream is None and not self.buffer.closed:
+                    self.stream = self.audio.open_stream(
+                        self.decoder.frequency, self.decoder.channels, self.pull
+                    )
+                    self.stream.volume = self.volume
+                    self.started.set()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.decoder.close()
+            self.started.set()
+
+    def close(self):
+        self.buffer.close()
+        self.thread.join()
+        if self.stream is not None:
+            self.stream.close()
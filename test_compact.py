@@ -0,0 +1,43 @@
+'''
+compact.die copies random.randint's private sampling instead of calling it,
+and the compact engine is only correct while the two draw the same numbers.
+'''
+import random
+
+import compact
+import utils
+
+
+SEEDS = range(200)
+SIZES = [1, 2, 4, 6, 10, 20, 100]
+# (quantity, size, advantage, disadvantage), as the actions roll them
+ROLLS = [
+    (1, 20, 0, 0),
+    (1, 4, 0, 0),
+    (1, 6, 2, 0),
+    (1, 10, 2, 0),
+    (1, 10, 0, 1),
+    (1, 20, 0, 1),
+    (2, 6, 0, 0),
+    (3, 6, 1, 0),
+    (2, 4, 0, 2),
+]
+
+
+def test_die_matches_randint():
+    for seed in SEEDS:
+        random.seed(seed)
+        expected = [random.randint(1, size) for size in SIZES * 10]
+        random.seed(seed)
+        assert [compact.die(size) for size in SIZES * 10] == expected
+
+
+def test_explode_roll_matches_utils():
+    for seed in SEEDS:
+        random.seed(seed)
+        expected = [utils.explode_roll(*args) for args in ROLLS * 5]
+        state = random.getstate()
+        random.seed(seed)
+        assert [compact.explode_roll(*args) for args in ROLLS * 5] == expected
+        # Drew as many numbers, so the rolls after these match too
+        assert random.getstate() == state
@@ -0,0 +1,151 @@
+'''
+Run the game rules on their own thread.
+
+The simulation thread owns the state: it applies queued key presses,
+runs screen.on_update at a fixed tick rate and publishes every new Model
+to a Mailbox. The platform thread only reads the latest published Model
+to draw it, which is safe because Models are immutable. Drawing stays on
+the platform thread since SDL renderers must be used from the thread
+that created them.
+'''
+import queue
+import threading
+import time
+import traceback
+
+
+class Mailbox:
+    '''
+    Single-slot mailbox. put() replaces whatever is there and take()
+    returns the latest item. Both are one attribute access, which is
+    atomic in CPython, so neither side ever waits for the other.
+    '''
+
+    def __init__(self, item=None):
+        self.item = item
+
+    def put(self, item):
+        self.item = item
+
+    def take(self):
+        return self.item
+
+
+class Published:
+    '''
+    A state as published: the Model, a sequence number, when it was
+    published and when the oldest key press it includes was queued.
+    '''
+
+    def __init__(self, state, number, published_at, input_at=None):
+        self.state = state
+        self.number = number
+        self.published_at = published_at
+        self.input_at = input_at
+
+
+class Simulation:
+
+    def __init__(self, state, screen, tick_rate, clock=time.perf_counter):
+        '''
+        screen(state) returns the screen module for the state.
+        '''
+        self.screen = screen
+        self.tick_rate = tick_rate
+        self.clock = clock
+        self.state = state
+        self.mailbox = Mailbox(Published(state, 0, clock()))
+        self.keys = queue.SimpleQueue()
+        self.effects = queue.SimpleQueue()
+        self.ticks = 0
+        # Lower tick rate while idle, see throttle()
+        self.rate = None
+        self.running = False
+        self.thread = threading.Thread(
+            target=self.run, name='simulation', daemon=True
+        )
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def throttle(self, rate):
+        '''
+        Ticks at most rate times a second, or at the full tick rate if rate
+        is None. The idle governor uses this to slow the rules down with
+        the frames.
+        '''
+        self.rate = rate
+
+    def current_rate(self):
+        if self.rate is None:
+            return self.tick_rate
+        return min(self.rate, self.tick_rate)
+
+    def send(self, key):
+        self.keys.put((key, self.clock()))
+
+    def take_effects(self):
+        effects = []
+        while True:
+            try:
+                effects.append(self.effects.get_nowait())
+            except queue.Empty:
+                return effects
+
+    def publish(self, state, input_at=None):
+        # Hand the effects over separately, the renderer may skip states
+        for effect in state.effects:
+            self.effects.put(effect)
+        state = state.clear_effects()
+        if state is not self.state or input_at is not None:
+            self.state = state
+            number = self.mailbox.take().number + 1
+            self.mailbox.put(Published(state, number, self.clock(), input_at))
+
+    def press(self, key, queued_at):
+        state = self.screen(self.state).on_key_down(key, self.state)
+        self.publish(state, queued_at)
+
+    def step(self):
+        while True:
+            try:
+                self.press(*self.keys.get_nowait())
+            except queue.Empty:
+                break
+        self.publish(self.screen(self.state).on_update(self.state))
+        self.ticks += 1
+
+    def run(self):
+        rate = self.current_rate()
+        next_tick = self.clock()
+        while self.running:
+            if self.current_rate() != rate:
+                # Back to full speed at once rather than after a slow tick
+                rate = self.current_rate()
+                next_tick = min(next_tick, self.clock() + 1 / rate)
+            delay = next_tick - self.clock()
+            if delay > 0:
+                # Handle key presses as they come rather than on the next
+                # tick. A press that fails leaves the tick schedule alone.
+                try:
+                    key = self.keys.get(timeout=delay)
+                except queue.Empty:
+                    continue
+                try:
+                    self.press(*key)
+                except Exception:
+                    traceback.print_exc()
+                continue
+            try:
+                self.step()
+            except Exception:
+                traceback.print_exc()
+            next_tick += 1 / rate
+            if next_tick < self.clock():
+                # Behind: start counting from now rather than rushing
+                next_tick = self.clock()
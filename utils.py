@@ -43,4 +43,16 @@ def clamp(value, minimum, maximum):
         return value
 
 def set_scene(state, **kwargs):
-    return state.set(scene=state.scene.set(**kwargs))
+    scene = state.scene.update(**kwargs)
+    if scene is state.scene:
+        return state
+    return state.set(scene=scene)
+
+
+def png_size(filename):
+    with open(filename, 'rb') as f:
+        header = f.read(24)
+    return (
+        int.from_bytes(header[16:20], 'big'),
+        int.from_bytes(header[20:24], 'big')
+    )